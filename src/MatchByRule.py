@@ -1,3 +1,7 @@
+from lib import instrument
+from lib.dictstore import snapshotOf
+from lib.segmentation import Segmentation
+
 """
 基于规则的分词技术一：
 正向最大匹配算法
@@ -6,22 +10,27 @@
 如果匹配则向下继续，不匹配则去掉最后一个字符重复上述操作。
 """
 class MM(object):
-    def __init__(self, dictionary, dict_max_length):
-        # 维护的词表
+    def __init__(self, dictionary, dict_max_length=None):
+        # 维护的词表，也可以是lib.dictstore.DictionaryStore，此时每次切分取一次快照，最大长度取快照中的
         self.dictionary = dictionary
         # 此表中词的最大长度
         self.dict_max_length = dict_max_length
 
     def cut(self, text: str) -> list:
-        # 切分结果
-        result = []
+        return self.cutSpans(text).toList()
+
+    def cutSpans(self, text: str) -> Segmentation:
+        # 切分结果，只记录每个词的下标
+        result = Segmentation(text)
+        dictionary, dict_max_length = snapshotOf(self.dictionary, self.dict_max_length)
+        text_length = len(text)
         current_index = 0
-        while current_index < len(text):
-            for i in range(self.dict_max_length, 0, -1):
+        while current_index < text_length:
+            for i in range(dict_max_length, 0, -1):
                 sub_text = text[current_index: current_index + i]
-                if sub_text in self.dictionary:
-                    # 如果在词表中找到，切分并进行下一轮匹配
-                    result.append(sub_text)
+                if sub_text in dictionary or i == 1:
+                    # 如果在词表中找到（或只剩一个字），切分并进行下一轮匹配
+                    result.append(current_index, min(current_index + i, text_length))
                     current_index = current_index + i
                     break
         return result
@@ -35,27 +44,35 @@ class MM(object):
 ，直到匹配或者只剩一个字，加入结果中，再向前移动一个步长，依次类推直到结束
 """
 class RMM(object):
-    def __init__(self, dictionary, maxLength):
-        # 维护的词表
+    def __init__(self, dictionary, maxLength=None):
+        # 维护的词表，也可以是lib.dictstore.DictionaryStore
         self.dictionary = dictionary
         # 此表中词的最大长度
         self.maxLength = maxLength
 
     def cut(self, text: str) -> list:
-        # 切分结果
-        result = []
+        return self.cutSpans(text).toList()
+
+    def cutSpans(self, text: str) -> Segmentation:
+        # 切分结果，从后向前依次记录每个词的结束、开始下标
+        result = Segmentation(text)
+        dictionary, maxLength = snapshotOf(self.dictionary, self.maxLength)
         textLength = len(text)
         currentIndex = textLength - 1
         while currentIndex >= 0:
-            for length in range(self.maxLength, 0, -1):
-                subText = text[currentIndex + 1 - length: currentIndex + 1]
-                if subText in self.dictionary or length == 1:
+            for length in range(maxLength, 0, -1):
+                begin = currentIndex + 1 - length
+                if begin < 0:
+                    # 剩下的字不够这个长度
+                    continue
+                subText = text[begin: currentIndex + 1]
+                if subText in dictionary or length == 1:
                     # 如果在词表中找到，切分并进行下一轮匹配
-                    result.append(subText)
+                    result.append(currentIndex + 1, begin)
                     currentIndex = currentIndex - length  # 移动指针
                     break
-        # 反转列表为正向
-        result.reverse()
+        # 反转下标数组为正向，每个词变为开始、结束下标
+        result.offsets.reverse()
         return result
 
 
@@ -68,30 +85,35 @@ class RMM(object):
 如果分词数量相同，返回单字数量较少的那个，如果单字数量相同，返回RMM的结果，因为RMM的认准率较高
 """
 class BMM:
-    def __init__(self, dictionary, maxLength):
-        # 维护的词表
+    def __init__(self, dictionary, maxLength=None):
+        # 维护的词表，也可以是lib.dictstore.DictionaryStore
         self.dictionary = dictionary
         # 此表中词的最大长度
         self.maxLength = maxLength
 
     def cut(self, text: str) -> list:
-        mmRes = MM(self.dictionary, self.maxLength).cut(text)
-        rmmRes = RMM(self.dictionary, self.maxLength).cut(text)
+        return self.cutSpans(text).toList()
+
+    def cutSpans(self, text: str) -> Segmentation:
+        with instrument.timer("bmm.cut"):
+            return self._cutSpans(text)
+
+    def _cutSpans(self, text: str) -> Segmentation:
+        instrument.incr("bmm.chars", len(text))
+        # 正向和逆向使用同一个快照
+        dictionary, maxLength = snapshotOf(self.dictionary, self.maxLength)
+        with instrument.timer("bmm.mm"):
+            mmRes = MM(dictionary, maxLength).cutSpans(text)
+        with instrument.timer("bmm.rmm"):
+            rmmRes = RMM(dictionary, maxLength).cutSpans(text)
         # 分词数量不同返回分词数较少的那个
         if not len(mmRes) == len(rmmRes):
             result = rmmRes if len(mmRes) > len(rmmRes) else mmRes
         else:
-            # 完全一样返回任意一个，不一样返回单字较少的一个
-            same = True
-            mmSingleWordCount = 0
-            rmmSingleWordCount = 0
-            for i in range(len(mmRes)):
-                if same and (not mmRes[i] == rmmRes[i]):
-                    same = False
-                if len(mmRes[i]) == 1:
-                    mmSingleWordCount += 1
-                if len(rmmRes[i]) == 1:
-                    rmmSingleWordCount += 1
+            # 完全一样返回任意一个，不一样返回单字较少的一个，只比较下标，不生成字符串
+            same = mmRes.offsets == rmmRes.offsets
+            mmSingleWordCount = sum(1 for length in mmRes.lengths() if length == 1)
+            rmmSingleWordCount = sum(1 for length in rmmRes.lengths() if length == 1)
             # 完全一样返回任意一个
             if same:
                 result = mmRes
@@ -1,7 +1,14 @@
+import heapq
+import math
 import os
 import pickle
 import time
 
+from lib import instrument
+from lib.corpuscache import CorpusCache, fileSha1
+from lib.emission import EmissionTable
+from lib.segmentation import Segmentation
+
 """
 基于统计的分词。通过使用隐含马尔可夫（HMM）模型实现。
 HMM使用状态来表示一个字在一个词中的位置，如状态为[B, M, E, S]分别表示这个字在词语中词首、词中、词尾和单独成词。通过统计一定数量的语料
@@ -20,12 +27,28 @@ class HMM:
         self.transP = {}  # key是状态，value是一个字典，这个字典的key是状态，value是转移到这一个状态的概率
         # 发射概率，状态到词语的条件概率，（在某个状态下是某个字的概率）
         self.emitP = {}  # key是状态，value是一个字典，这个字典的key是具体的字，value是这个字被发射的概率
+        # 按内存预算加载时是lib.emission.EmissionTable
         # 状态初始概率
         self.startP = {}  # key是状态，value是这个状态作为初始状态的概率
         # 状态集合
         self.stateList = ["B", "M", "E", "S"]
+        # 取对数之后的模型，用于N-best和边缘概率，第一次使用时由上面三个概率转化
+        self._logModel = None
 
-    def loadModel(self):
+    def loadModel(self, emissionBudget=None, dtype="f"):
+        """
+        加载模型
+        :param emissionBudget: 发射概率表的内存预算（字节），为None时发射概率是完整的嵌套字典，否则是按预算压缩的EmissionTable
+        :param dtype: 压缩时概率的存储类型，f是float32，e是float16
+        :return: void
+        """
+        self._logModel = None
+        # 重新加载时关闭之前映射的文件
+        if isinstance(self.emitP, EmissionTable):
+            self.emitP.close()
+            self.emitP = {}
+        if emissionBudget is not None and self._loadEmissionTable(emissionBudget, dtype):
+            return
         if os.path.exists(self.modelPath):
             # 已经训练好了，把结果读取进内存
             with open(self.modelPath, "rb") as f:
@@ -35,91 +58,145 @@ class HMM:
         else:
             # 训练模型
             self.trainModel()
+        if emissionBudget is not None:
+            self._buildEmissionTable(emissionBudget, dtype)
 
-    def trainModel(self):
-        # 对一个词做状态标注
-        def makeLabel(w):
-            if len(w) == 1:
-                res = ["S"]
-            elif len(w) == 2:
-                res = ["B", "E"]
-            else:
-                res = ["B"] + ["M"] * (len(w) - 2) + ["E"]
-            return res
+    def emissionTablePath(self, emissionBudget, dtype="f"):
+        return "{0}_emit_{1}{2}".format(self.modelPath, emissionBudget, dtype)
 
+    def _loadEmissionTable(self, emissionBudget, dtype):
+        """
+        加载压缩过的模型，模型文件变化之后需要重新压缩
+        :return: 是否加载成功
+        """
+        path = self.emissionTablePath(emissionBudget, dtype)
+        if not os.path.exists(path) or not os.path.exists(self.modelPath):
+            return False
+        table = EmissionTable.load(path)
+        if table is None:
+            return False
+        if table.header.get("modelSha1") != fileSha1(self.modelPath):
+            table.close()
+            return False
+        self.transP = table.header["transP"]
+        self.startP = table.header["startP"]
+        self.emitP = table
+        return True
+
+    def _buildEmissionTable(self, emissionBudget, dtype):
+        """
+        按预算压缩发射概率，连同初始概率、转移概率保存，再映射回来替换掉嵌套字典
+        """
+        extra = {"startP": self.startP, "transP": self.transP, "modelSha1": fileSha1(self.modelPath)}
+        path = self.emissionTablePath(emissionBudget, dtype)
+        EmissionTable.build(self.emitP, self.stateList, emissionBudget, dtype, extra).save(path)
+        self.emitP = EmissionTable.load(path)
+
+    def trainModel(self):
+        self._logModel = None
         countDic = {}  # 每个状态出现的次数，key 是状态，value为对应状态在训练集中出现的次数
-        # 参数初始化
+        # 参数初始化，emitP可能是加载的EmissionTable，重新绑定为字典
+        self.transP, self.emitP, self.startP = {}, {}, {}
         for state in self.stateList:
             self.transP[state] = {s: 0.0 for s in self.stateList}
             self.emitP[state] = {}
             self.startP[state] = 0.0
             countDic[state] = 0
-        lineNum = -1  # 训练集的行数
-        wordSet = set()  # 字集合
-        with open(self.trainingSetPath, encoding="utf8") as f:
-            for line in f:
-                lineNum = lineNum + 1
-                line = line.strip()
-                if not line:
-                    continue
-                wordList = [i for i in line if i != " "]  # 这一行的所有字和标点，去掉空格
-                # 更新字集合
-                wordSet |= set(wordList)
-                lineList = line.split()  # 这一行的所有词语
-                lineState = []  # 这一行每个字的状态
-                # 状态标注
-                for words in lineList:
-                    lineState.extend(makeLabel(words))
-                assert len(wordList) == len(lineState)
-                # 更新初始概率，状态转移概率、发射概率
-                for index, value in enumerate(lineState):
-                    countDic[value] += 1
-                    if index == 0:
-                        # 更新状态初始概率
-                        self.startP[value] += 1
-                    else:
-                        # 更新状态转移概率
-                        self.transP[lineState[index - 1]][value] += 1
-                        # 更新发射概率
-                        self.emitP[value][wordList[index]] = self.emitP[value].get(wordList[index], 0) + 1
-            # 将统计的初始状态次数转化为概率
-            self.startP = {k: v * 1.0 / lineNum for k, v in self.startP.items()}
-            # 将统计的状态转化次数转化为概率
-            for k, v in self.transP.items():
-                for k1, v1 in v.items():
-                    self.transP[k][k1] = v1 * 1.0 / countDic[k]
-            # 将统计的特定状态下某个字出现的次数转化成发射概率，需要加1平滑
-            for k, v in self.emitP.items():
-                for k1, v1 in v.items():
-                    self.emitP[k][k1] = (v1 + 1) * 1.0 / countDic[k]
-            # 缓存模型
-            with open(self.modelPath, "wb") as modelFile:
-                pickle.dump(self.transP, modelFile)
-                pickle.dump(self.emitP, modelFile)
-                pickle.dump(self.startP, modelFile)
+        # 读取语料缓存，字和状态标注（BMES）都已经转化为整数id，不需要再切分文本
+        corpus = CorpusCache.load(self.trainingSetPath)
+        vocab = corpus.vocab
+        tagList = corpus.labels["tag"]
+        charIds, tags, offsets = corpus.charIds, corpus.column("tag"), corpus.offsets
+        # 先按id计数，最后再转化为按状态和字索引的概率
+        stateCount = [0] * len(tagList)
+        startCount = [0] * len(tagList)
+        transCount = [[0] * len(tagList) for _ in tagList]
+        emitCount = [{} for _ in tagList]
+        for i in range(len(corpus)):
+            begin, end = offsets[i], offsets[i + 1]
+            if begin == end:
+                continue
+            # 更新状态初始概率
+            prev = tags[begin]
+            stateCount[prev] += 1
+            startCount[prev] += 1
+            for index in range(begin + 1, end):
+                t = tags[index]
+                stateCount[t] += 1
+                # 更新状态转移概率
+                transCount[prev][t] += 1
+                # 更新发射概率
+                emit = emitCount[t]
+                emit[charIds[index]] = emit.get(charIds[index], 0) + 1
+                prev = t
+        lineNum = corpus.sourceLines - 1  # 训练集的行数
+        for t, state in enumerate(tagList):
+            countDic[state] = stateCount[t]
+            self.startP[state] = startCount[t]
+            for t1, state1 in enumerate(tagList):
+                self.transP[state][state1] = transCount[t][t1]
+            self.emitP[state] = {vocab[c]: n for c, n in emitCount[t].items()}
+        corpus.close()
+        # 将统计的初始状态次数转化为概率
+        self.startP = {k: v * 1.0 / lineNum for k, v in self.startP.items()}
+        # 将统计的状态转化次数转化为概率
+        for k, v in self.transP.items():
+            for k1, v1 in v.items():
+                self.transP[k][k1] = v1 * 1.0 / countDic[k]
+        # 将统计的特定状态下某个字出现的次数转化成发射概率，需要加1平滑
+        for k, v in self.emitP.items():
+            for k1, v1 in v.items():
+                self.emitP[k][k1] = (v1 + 1) * 1.0 / countDic[k]
+        # 缓存模型
+        with open(self.modelPath, "wb") as modelFile:
+            pickle.dump(self.transP, modelFile)
+            pickle.dump(self.emitP, modelFile)
+            pickle.dump(self.startP, modelFile)
+
+    def _emissionsOf(self, ch, emitP):
+        """
+        一个字在各状态下的发射概率
+        :param ch: 字
+        :param emitP: 发射概率，嵌套字典或EmissionTable
+        :return: 按stateList顺序的list，没有出现在发射概率中的字返回None
+        """
+        if isinstance(emitP, EmissionTable):
+            return emitP.emissions(ch)
+        if not any(ch in emitP[state] for state in self.stateList):
+            return None
+        return [emitP[state].get(ch, 0) for state in self.stateList]
 
     def viterbi(self, text, startP, transP, emitP):
+        with instrument.timer("hmm.viterbi"):
+            return self._viterbi(text, startP, transP, emitP)
+
+    def _viterbi(self, text, startP, transP, emitP):
         v = [{}]  # 递推的概率，是一个list，表示每个字是某个状态的概率，list的子项是字典，key是状态，value是这个状态的概率
         path = {}  # 路径，key是当前进度最后一个字的状态，value是从开始到当前进度key状态的最优路径
-        # 确定初始概率
-        for state in self.stateList:
-            v[0][state] = startP[state] * emitP[state].get(text[0], 0)
+        oov = 0  # 没有出现在发射概率中的字数
+        # 确定初始概率，没出现在发射概率中的字与后面的字一样，在所有状态下发射概率都按1计算
+        emission = self._emissionsOf(text[0], emitP)
+        if emission is None:
+            oov += 1
+            emission = [1.0] * len(self.stateList)
+        for k, state in enumerate(self.stateList):
+            v[0][state] = startP[state] * emission[k]
             path[state] = [state]
         # 从第二个字开始递推，找到最优路径
         for t in range(1, len(text)):
             v.append({})
             newPath = {}  # 处理完这个字之后的新路径
-            seen = False  # 这个字是否出现在发射概率中, 没出现的字一定会发射，单独成词
-            for state in self.stateList:
-                if text[t] in emitP[state].keys():
-                    seen = True
-                    break
-            for y in self.stateList:  # y是下标t的字的状态
+            # 这个字在各状态下的发射概率，没出现在发射概率中的字为None, 一定会发射，单独成词
+            emission = self._emissionsOf(text[t], emitP)
+            if emission is None:
+                oov += 1
+            for k, y in enumerate(self.stateList):  # y是下标t的字的状态
                 # 因为使用的是二元语言模型，前面的一个字会影响后面的字，因此考虑上一个字的状态，找到从上一个字的状态转移到y状态的最大概率
                 # 及状态，拿到状态转移路径
                 maxP, state = -1, ""
+                e = emission[k] if emission is not None else 1.0
                 for y0 in self.stateList:  # y0是下标t-1的字的状态
-                    p = v[t-1][y0] * transP[y0][y] * (emitP[y].get(text[t], 0) if seen else 1.0)
+                    p = v[t-1][y0] * transP[y0][y] * e
                     if p > maxP:
                         maxP, state = p, y0
                 # 更新路径和递推概率
@@ -132,28 +209,212 @@ class HMM:
         for state, p in v[len(text) - 1].items():
             if p > mP:
                 mState, mP = state, p
+        instrument.incr("hmm.chars", len(text))
+        instrument.incr("hmm.oov", oov)
         # 返回最大概率的状态路径及其概率
         return mP, path[mState]
 
     def cut(self, text: str):
+        """
+        分词，依次返回每个词，最后一项是路径的概率。不需要概率时使用cutSpans
+        """
+        result = self.cutSpans(text)
+        for word in result:
+            yield word
+        yield result.probability
+
+    def cutSpans(self, text: str) -> Segmentation:
+        """
+        分词，结果只记录每个词的下标，路径的概率在probability属性中
+        """
         # if not os.path.exists(self.modelPath):
         #     self.trainModel()
+        instrument.incr("hmm.cut.calls")
         # 使用训练结果结合viterbi算法拿到最大概率的状态路径及概率值
         p, stateList = self.viterbi(text, self.startP, self.transP, self.emitP)
+        return self._toSegmentation(text, stateList, p)
+
+    @staticmethod
+    def _toSegmentation(text, stateList, probability):
+        """
+        根据状态路径切分
+        """
+        result = Segmentation(text, probability=probability)
         begin, next = 0, 0
-        for i, char in enumerate(text):
+        for i in range(len(text)):
             state = stateList[i]
             if state == "B":
                 begin = i
             elif state == "E":
-                yield text[begin: i + 1]
+                result.append(begin, i + 1)
                 next = i + 1
             elif state == "S":
-                yield char
+                result.append(i, i + 1)
                 next = i + 1
         if next < len(text):
-            yield text[next:]
-        yield p
+            result.append(next, len(text))
+        return result
+
+    def _getLogModel(self):
+        """
+        把初始概率、转移概率、发射概率转化为对数，概率为0时对数为负无穷
+        :return: (初始概率, 转移概率, 发射概率)，都按状态在stateList中的下标索引，发射概率是每个状态一个字典，
+                 emitP是EmissionTable时发射概率就是这个表（表中存的已经是对数）
+        """
+        if self._logModel is None:
+            states = self.stateList
+            logStart = [_log(self.startP[s]) for s in states]
+            logTrans = [[_log(self.transP[s0][s1]) for s1 in states] for s0 in states]
+            if isinstance(self.emitP, EmissionTable):
+                logEmit = self.emitP
+            else:
+                logEmit = [{ch: _log(p) for ch, p in self.emitP[s].items()} for s in states]
+            self._logModel = (logStart, logTrans, logEmit)
+        return self._logModel
+
+    def _logEmissions(self, text):
+        """
+        每个字在每个状态下的发射概率的对数。与viterbi一致，没有出现在发射概率中的字在所有状态下发射概率都按1计算
+        :return: 每个字一个list，按状态下标索引
+        """
+        logEmit = self._getLogModel()[2]
+        if isinstance(logEmit, EmissionTable):
+            res = []
+            for ch in text:
+                logs = logEmit.logEmissions(ch)
+                res.append(list(logs) if logs is not None else [0.0] * len(self.stateList))
+            return res
+        res = []
+        for ch in text:
+            if any(ch in emit for emit in logEmit):
+                res.append([emit.get(ch, _NEG_INF) for emit in logEmit])
+            else:
+                res.append([0.0] * len(logEmit))
+        return res
+
+    def viterbiNBest(self, text, n=5):
+        """
+        对数空间下的k-best viterbi，每个字的每个状态只保留前n条路径，内存与字数×状态数×n成正比
+        :param text: 文本
+        :param n: 路径数
+        :return: [(路径概率的对数, 状态路径)]，按概率从大到小排列，概率为0的路径不返回
+        """
+        with instrument.timer("hmm.nbest"):
+            if not text:
+                return []
+            logStart, logTrans, _ = self._getLogModel()
+            emissions = self._logEmissions(text)
+            stateIds = range(len(self.stateList))
+            # back[t][y]是下标t的字处于状态y的前n条路径，每项是(对数概率, 上一个字的状态, 在上一个字该状态的路径中的名次)
+            back = [[[(logStart[y] + emissions[0][y], -1, 0)] for y in stateIds]]
+            for t in range(1, len(text)):
+                prev = back[t - 1]
+                emission = emissions[t]
+                current = []
+                for y in stateIds:
+                    if emission[y] == _NEG_INF:
+                        current.append([])
+                        continue
+                    # 从所有上一个状态的路径中取前n条，heapq.nlargest内部只维护n个元素的堆
+                    candidates = ((score + logTrans[y0][y] + emission[y], y0, rank)
+                                  for y0 in stateIds for rank, (score, _, _) in enumerate(prev[y0]))
+                    current.append([c for c in heapq.nlargest(n, candidates) if c[0] != _NEG_INF])
+                back.append(current)
+            last = len(text) - 1
+            finals = heapq.nlargest(n, ((back[last][y][rank][0], y, rank)
+                                        for y in stateIds for rank in range(len(back[last][y]))))
+            res = []
+            for score, y, rank in finals:
+                if score == _NEG_INF:
+                    continue
+                path = []
+                for t in range(last, -1, -1):
+                    path.append(self.stateList[y])
+                    _, y, rank = back[t][y][rank]
+                path.reverse()
+                res.append((score, path))
+            return res
+
+    def forwardBackward(self, text):
+        """
+        对数空间下的前向后向算法，计算每个字处于每个状态的边缘概率
+        :param text: 文本
+        :return: 所有路径概率之和的对数，及每个字的边缘概率（按状态下标索引的list）
+        """
+        with instrument.timer("hmm.forwardBackward"):
+            if not text:
+                return _NEG_INF, []
+            logStart, logTrans, _ = self._getLogModel()
+            emissions = self._logEmissions(text)
+            stateIds = range(len(self.stateList))
+            alpha = [[logStart[y] + emissions[0][y] for y in stateIds]]
+            for t in range(1, len(text)):
+                prev = alpha[t - 1]
+                alpha.append([emissions[t][y] + _logSumExp([prev[y0] + logTrans[y0][y] for y0 in stateIds])
+                              for y in stateIds])
+            logZ = _logSumExp(alpha[-1])
+            marginals = [None] * len(text)
+            # 后向概率只保留下一个字的，算完一个字的边缘概率之后就丢弃
+            beta = [0.0] * len(self.stateList)
+            for t in range(len(text) - 1, -1, -1):
+                if t < len(text) - 1:
+                    emission = emissions[t + 1]
+                    beta = [_logSumExp([logTrans[y][y1] + emission[y1] + beta[y1] for y1 in stateIds])
+                            for y in stateIds]
+                marginals[t] = [_exp(alpha[t][y] + beta[y] - logZ) for y in stateIds]
+            return logZ, marginals
+
+    def cutNBest(self, text: str, n=5) -> list:
+        """
+        前n个分词结果。不同的状态路径可能得到相同的切分，此时只保留概率最大的，因此结果可能少于n个
+        :param text: 文本
+        :param n: 路径数
+        :return: Segmentation的list，probability是该路径在给定文本下的条件概率
+        """
+        paths = self.viterbiNBest(text, n)
+        if not paths:
+            return []
+        logZ, _ = self.forwardBackward(text)
+        res = []
+        seen = set()
+        for score, stateList in paths:
+            result = self._toSegmentation(text, stateList, _exp(score - logZ))
+            key = result.offsets.tobytes()
+            if key not in seen:
+                seen.add(key)
+                res.append(result)
+        return res
+
+    def tokenConfidence(self, text: str) -> list:
+        """
+        每个字最可能的状态及其边缘概率，可以作为主动学习中挑选样本的依据
+        :param text: 文本
+        :return: [(字, 状态, 边缘概率)]
+        """
+        _, marginals = self.forwardBackward(text)
+        res = []
+        for ch, m in zip(text, marginals):
+            y = max(range(len(m)), key=m.__getitem__)
+            res.append((ch, self.stateList[y], m[y]))
+        return res
+
+
+_NEG_INF = float("-inf")
+
+
+def _log(p):
+    return math.log(p) if p > 0 else _NEG_INF
+
+
+def _exp(x):
+    return math.exp(x) if x != _NEG_INF else 0.0
+
+
+def _logSumExp(values):
+    m = max(values)
+    if m == _NEG_INF:
+        return _NEG_INF
+    return m + math.log(sum(math.exp(v - m) for v in values))
 
 
 if __name__ == '__main__':
@@ -166,3 +427,5 @@ if __name__ == '__main__':
     hmm.loadModel()
     res = hmm.cut("书中使用的语料库是人民日报的分词语料。测试一下：")
     print(str(list(res)))
+    for seg in hmm.cutNBest("书中使用的语料库是人民日报的分词语料。测试一下：", 3):
+        print(seg.probability, seg.toList())
@@ -0,0 +1,416 @@
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from multiprocessing import get_context
+
+"""
+基准测试。对所有分词器（MM、RMM、BMM、HMM）、关键词提取（TF、TFIDF、TextRank）和实体识别器（TimeRecognition、NerLocation）在自带语料上按不同输入规模进行测试，
+统计每秒处理字数、单句延迟的p50/p99以及进程峰值内存（RSS），结果保存为json，并可以与保存的基线结果对比，找出性能退化的用例。
+每个用例（测试对象 × 语料 × 规模）都在单独的子进程中运行，保证峰值内存互不干扰；语料按固定顺序循环截取，保证结果可复现。
+另外在新的解释器中测量导入所有模块的耗时，超过STARTUP_BUDGET_MS同样视为退化。
+
+用法（在src目录下运行）：
+    python benchmark.py                                  运行全部用例并与基线对比
+    python benchmark.py --targets MM HMM --sizes 1000    只运行部分用例
+    python benchmark.py --save-baseline                  把本次结果保存为新的基线
+    python benchmark.py --startup-only                   只检查导入耗时
+"""
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NER_DIR = os.path.join(BASE_DIR, "ner")
+
+# 语料名 -> (路径, 格式)
+CORPORA = {
+    "t": (os.path.join(BASE_DIR, "data", "t.txt"), "gold"),
+    "news": (os.path.join(BASE_DIR, "data", "news.txt"), "plain"),
+    "testset": (os.path.join(NER_DIR, "data", "testset.txt"), "charTag"),
+}
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_OUTPUT = os.path.join(BASE_DIR, "data", "benchmark_result.json")
+DEFAULT_BASELINE = os.path.join(BASE_DIR, "data", "benchmark_baseline.json")
+STARTUP_BUDGET_MS = 100
+
+
+def discoverModules():
+    """
+    源码目录（src、src/lib、src/ner）下的所有模块，基准测试脚本本身除外
+    :return: 模块名列表
+    """
+    modules = []
+    for package in ["", "lib", "ner"]:
+        for name in sorted(os.listdir(os.path.join(BASE_DIR, package))):
+            if not name.endswith(".py") or name == "__init__.py":
+                continue
+            module = name[:-3]
+            if package == "" and module == "benchmark":
+                continue
+            modules.append(package + "." + module if package else module)
+    return modules
+
+
+# 冷启动时需要导入的模块，导入时不应该加载jieba、CRFPP、langid
+STARTUP_MODULES = discoverModules()
+
+
+def readSentences(path, fmt):
+    """
+    读取语料中的句子
+    :param path: 语料路径
+    :param fmt: 语料格式，gold为空格分隔的分词语料，plain为普通文本，charTag为每行一个字加标签、空行分句的语料
+    :return: 句子列表
+    """
+    sentences = []
+    with open(path, encoding="utf8") as f:
+        if fmt == "charTag":
+            chars = []
+            for line in f:
+                line = line.strip()
+                if line == "":
+                    if chars:
+                        sentences.append("".join(chars))
+                        chars = []
+                else:
+                    chars.append(line.split()[0])
+            if chars:
+                sentences.append("".join(chars))
+        else:
+            for line in f:
+                line = line.strip().strip("　")
+                if fmt == "gold":
+                    line = "".join(line.split())
+                if line != "":
+                    sentences.append(line)
+    return sentences
+
+
+def loadSamples(corpus, size):
+    """
+    从语料中按顺序截取总字数为size的句子，语料不够时从头循环
+    :param corpus: 语料名
+    :param size: 总字数
+    :return: 句子列表
+    """
+    path, fmt = CORPORA[corpus]
+    sentences = readSentences(path, fmt)
+    res = []
+    total = 0
+    i = 0
+    while total < size:
+        sentence = sentences[i % len(sentences)][:size - total]
+        res.append(sentence)
+        total += len(sentence)
+        i += 1
+    return res
+
+
+def loadDictionary():
+    """
+    从分词语料data/t.txt中构建规则分词使用的词表
+    :return: 词表和词的最大长度
+    """
+    words = set()
+    with open(CORPORA["t"][0], encoding="utf8") as f:
+        for line in f:
+            words.update(line.split())
+    return words, max(len(w) for w in words)
+
+
+def _makeMM():
+    from MatchByRule import MM
+    dictionary, maxLength = loadDictionary()
+    return MM(dictionary, maxLength).cut
+
+
+def _makeRMM():
+    from MatchByRule import RMM
+    dictionary, maxLength = loadDictionary()
+    return RMM(dictionary, maxLength).cut
+
+
+def _makeBMM():
+    from MatchByRule import BMM
+    dictionary, maxLength = loadDictionary()
+    return BMM(dictionary, maxLength).cut
+
+
+def _makeHMM():
+    from MatchByStatistics import HMM
+    hmm = HMM("data/trainingSet.txt")
+    hmm.loadModel()
+    return lambda text: list(hmm.cut(text))
+
+
+def _makeTF():
+    from jiebatest import TF
+    from lib import jiebaloader
+    # jieba是延迟加载的，在构造时加载，不计入延迟
+    jiebaloader.prebuild()
+    tf = TF(CORPORA["news"][0], stopWordsPath="data/stopWords.txt")
+
+    def run(text):
+        tf.setContent(text)
+        return tf.getTFWithStopWords()
+    return run
+
+
+def _makeKeywords(mode):
+    from jiebatest import TF
+    from lib import jiebaloader, keywords
+    jiebaloader.prebuild()
+    tf = TF(CORPORA["news"][0], stopWordsPath="data/stopWords.txt")
+    # 逆文档频率表在构造时加载
+    idfTable = keywords.IdfTable.fromCorpus(CORPORA["t"][0])
+    tf.getKeywords(mode=mode, idfTable=idfTable)
+
+    def run(text):
+        tf.setContent(text)
+        return tf.getKeywords(mode=mode)
+    return run
+
+
+def _makeTFIDF():
+    return _makeKeywords("tfidf")
+
+
+def _makeTextRank():
+    return _makeKeywords("textrank")
+
+
+def _makeTimeRecognition():
+    from ner.ner_time import TimeRecognition
+    from lib import jiebaloader
+    jiebaloader.prebuild()
+    tr = TimeRecognition()
+    return tr.recognize
+
+
+def _makeNerLocation():
+    from ner.ner_location import NerLocation
+    import CRFPP
+    if not os.path.exists("data/model"):
+        raise FileNotFoundError("CRF model ner/data/model not found")
+    return NerLocation.locationNER
+
+
+# 测试对象名 -> (构造函数, 运行时的工作目录, 使用的语料)
+TARGETS = {
+    "MM": (_makeMM, BASE_DIR, ["t", "news"]),
+    "RMM": (_makeRMM, BASE_DIR, ["t", "news"]),
+    "BMM": (_makeBMM, BASE_DIR, ["t", "news"]),
+    "HMM": (_makeHMM, BASE_DIR, ["t", "news"]),
+    "TF": (_makeTF, BASE_DIR, ["news", "t"]),
+    "TFIDF": (_makeTFIDF, BASE_DIR, ["news", "t"]),
+    "TextRank": (_makeTextRank, BASE_DIR, ["news", "t"]),
+    "TimeRecognition": (_makeTimeRecognition, NER_DIR, ["news", "testset"]),
+    "NerLocation": (_makeNerLocation, NER_DIR, ["testset", "news"]),
+}
+
+
+def percentile(values, q):
+    """
+    最近秩法求百分位数
+    :param values: 已排序的数值列表
+    :param q: 百分位，0~100
+    :return: 百分位数
+    """
+    if not values:
+        return 0.0
+    k = max(0, min(len(values) - 1, int(math.ceil(q * len(values) / 100.0)) - 1))
+    return values[k]
+
+
+def peakRssKb():
+    """
+    当前进程的峰值内存，单位KB（macOS下ru_maxrss的单位是字节）
+    :return: 峰值内存
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def runCase(target, corpus, size, repeat=3, warmup=20):
+    """
+    运行一个用例，在子进程中调用
+    :param target: 测试对象名
+    :param corpus: 语料名
+    :param size: 输入字数
+    :param repeat: 重复次数
+    :param warmup: 预热的句子数
+    :return: 统计结果
+    """
+    factory, workDir, _ = TARGETS[target]
+    res = {"target": target, "corpus": corpus, "size": size}
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    os.chdir(workDir)
+    samples = loadSamples(corpus, size)
+    try:
+        begin = time.perf_counter()
+        func = factory()
+        setupMs = (time.perf_counter() - begin) * 1000
+    except (ImportError, OSError) as e:
+        res["skipped"] = "{0}: {1}".format(type(e).__name__, e)
+        return res
+    latencies = []
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for text in samples[:warmup]:
+            func(text)
+        total = 0.0
+        for _ in range(repeat):
+            for text in samples:
+                begin = time.perf_counter()
+                func(text)
+                cost = time.perf_counter() - begin
+                latencies.append(cost)
+                total += cost
+    latencies.sort()
+    chars = sum(len(text) for text in samples)
+    res.update({
+        "chars": chars,
+        "sentences": len(samples),
+        "repeat": repeat,
+        "setupMs": round(setupMs, 3),
+        "charsPerSec": round(chars * repeat / total, 1) if total > 0 else 0.0,
+        "p50Ms": round(percentile(latencies, 50) * 1000, 4),
+        "p99Ms": round(percentile(latencies, 99) * 1000, 4),
+        "peakRssKb": peakRssKb(),
+    })
+    return res
+
+
+def runAll(targets, sizes, repeat=3):
+    """
+    运行所有用例，每个用例一个新的子进程
+    :param targets: 测试对象名列表
+    :param sizes: 输入字数列表
+    :param repeat: 重复次数
+    :return: 所有用例的统计结果
+    """
+    results = []
+    ctx = get_context("spawn")
+    for target in targets:
+        for corpus in TARGETS[target][2]:
+            for size in sizes:
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                    res = executor.submit(runCase, target, corpus, size, repeat).result()
+                results.append(res)
+                printResult(res)
+    return results
+
+
+def measureStartup(repeat=5):
+    """
+    在新的解释器中测量导入STARTUP_MODULES的耗时，不包含解释器自身的启动时间
+    :param repeat: 重复次数
+    :return: 统计结果
+    """
+    code = ("import time\n"
+            "begin = time.perf_counter()\n"
+            + "".join("import {0}\n".format(m) for m in STARTUP_MODULES)
+            + "print((time.perf_counter() - begin) * 1000)\n")
+    costs = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, "-c", code], cwd=BASE_DIR)
+        costs.append(float(out.decode().strip().splitlines()[-1]))
+    costs.sort()
+    return {
+        "modules": STARTUP_MODULES,
+        "medianMs": round(costs[len(costs) // 2], 3),
+        "maxMs": round(costs[-1], 3),
+        "budgetMs": STARTUP_BUDGET_MS,
+    }
+
+
+def printResult(res):
+    name = "{0:<16}{1:<10}{2:>8}".format(res["target"], res["corpus"], res["size"])
+    if "skipped" in res:
+        print(name + "  skipped (" + res["skipped"] + ")")
+    else:
+        print(name + "  {0:>12.1f} chars/s  p50 {1:>9.4f}ms  p99 {2:>9.4f}ms  rss {3:>8}KB".format(
+            res["charsPerSec"], res["p50Ms"], res["p99Ms"], res["peakRssKb"]))
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    与基线对比，找出性能退化的用例
+    :param results: 本次结果
+    :param baseline: 基线结果
+    :param tolerance: 允许的波动比例
+    :return: 退化描述列表
+    """
+    baseMap = {(r["target"], r["corpus"], r["size"]): r for r in baseline.get("results", [])
+               if "skipped" not in r and r["target"] != "startup"}
+    regressions = []
+    for res in results:
+        if res.get("target") == "startup":
+            if res["medianMs"] > res["budgetMs"]:
+                regressions.append("startup: import {0}ms over budget {1}ms".format(res["medianMs"], res["budgetMs"]))
+            continue
+        base = baseMap.get((res["target"], res["corpus"], res["size"]))
+        if base is None or "skipped" in res:
+            continue
+        name = "{0}/{1}/{2}".format(res["target"], res["corpus"], res["size"])
+        if res["charsPerSec"] < base["charsPerSec"] * (1 - tolerance):
+            regressions.append("{0}: charsPerSec {1} -> {2}".format(name, base["charsPerSec"], res["charsPerSec"]))
+        for key in ["p99Ms", "peakRssKb"]:
+            if res[key] > base[key] * (1 + tolerance):
+                regressions.append("{0}: {1} {2} -> {3}".format(name, key, base[key], res[key]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="segmenter and recognizer benchmark")
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS.keys()), choices=list(TARGETS.keys()))
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--startup-only", action="store_true")
+    args = parser.parse_args(argv)
+
+    startup = measureStartup()
+    startup["target"] = "startup"
+    print("startup import  median {0}ms  max {1}ms  (budget {2}ms)".format(
+        startup["medianMs"], startup["maxMs"], startup["budgetMs"]))
+    if args.startup_only:
+        return 1 if compare([startup], {}) else 0
+    results = runAll(args.targets, args.sizes, args.repeat) + [startup]
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print("baseline saved -> " + args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("no baseline found at " + args.baseline)
+        return 0
+    with open(args.baseline, encoding="utf8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for item in regressions:
+        print("REGRESSION " + item)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from lib.corpuscache import CorpusCache
+
+"""
+分词效果评测。以空格分隔的分词语料（与HMM.trainModel读取的data/trainingSet.txt格式相同）作为标准答案，通过语料缓存
+（lib.corpuscache）映射到内存，按句子下标分批交给多个进程中的分词器（MM、RMM、BMM、HMM）切分，
+统计词级别的准确率P、召回率R、F1以及未登录词召回率，同时给出处理速度，一次运行就可以比较各个分词器的速度和效果。
+
+比较时不拼接字符串，而是把标准答案和分词结果都转化为每个词在句子中的(开始, 结束)下标集合，两个集合的交集就是切对的词。
+未登录词是指不在训练语料词表中的词。默认把标准答案语料按行号每5行抽1行作为测试集（与NerLocation.handleCorpus一致），其余作为词表。
+
+用法（在src目录下运行）：
+    python evaluate.py
+    python evaluate.py --segmenters HMM BMM --gold data/t.txt --workers 4
+    python evaluate.py --gold test_gold.txt --train data/t.txt
+    python evaluate.py --emission-budgets full 65536 49152 --emission-dtype e   HMM在不同发射概率内存预算下的效果和内存
+"""
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SEGMENTERS = ["MM", "RMM", "BMM", "HMM"]
+
+_segmenter = None  # 工作进程中的分词函数
+_vocab = None  # 工作进程中的训练词表
+_corpus = None  # 工作进程中的标准答案语料缓存
+
+
+def isTest(i, split):
+    """
+    第i句是否属于测试集，split为True时每5句取1句作为测试集，否则全部是测试集
+    """
+    return not split or i % 5 == 0
+
+
+def buildVocab(corpus, split):
+    """
+    构建训练词表
+    :param corpus: 语料缓存
+    :param split: 是否按行号划分测试集，为True时只使用非测试集的句子
+    :return: 词表
+    """
+    vocab = set()
+    for i in range(len(corpus)):
+        if split and isTest(i, split):
+            continue
+        vocab.update(corpus.words(i))
+    return vocab
+
+
+def makeSegmenter(name, vocab, emissionBudget=None, dtype="f"):
+    """
+    构造分词器
+    :param name: 分词器名
+    :param vocab: 规则分词使用的词表
+    :param emissionBudget: HMM发射概率表的内存预算，见HMM.loadModel
+    :param dtype: HMM发射概率表的存储类型
+    :return: 分词函数，输入文本，返回Segmentation
+    """
+    if name == "HMM":
+        from MatchByStatistics import HMM
+        hmm = HMM(os.path.join(BASE_DIR, "data", "trainingSet.txt"))
+        hmm.loadModel(emissionBudget, dtype)
+        return hmm.cutSpans
+    import MatchByRule
+    maxLength = max(len(w) for w in vocab)
+    return getattr(MatchByRule, name)(vocab, maxLength).cutSpans
+
+
+def _initWorker(name, vocab, goldPath, emissionBudget=None, dtype="f"):
+    global _segmenter, _vocab, _corpus
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    _segmenter = makeSegmenter(name, vocab, emissionBudget, dtype)
+    _vocab = vocab
+    _corpus = CorpusCache.load(goldPath)
+
+
+def evaluateChunk(chunk):
+    """
+    评测一批句子，在工作进程中调用
+    :param chunk: 句子下标列表
+    :return: 计数 [句子数, 字数, 标准答案词数, 分词结果词数, 切对的词数, 未登录词数, 切对的未登录词数, 切分耗时]
+    """
+    counts = [0, 0, 0, 0, 0, 0, 0, 0.0]
+    for i in chunk:
+        # 标准答案的词位置直接由缓存中的状态标注得到，只有查未登录词时才切出字符串
+        text = _corpus.text(i)
+        if not text:
+            continue
+        begin = time.perf_counter()
+        predSpans = set(_segmenter(text).spans())
+        counts[7] += time.perf_counter() - begin
+        goldSpans = set(_corpus.spans(i))
+        counts[0] += 1
+        counts[1] += len(text)
+        counts[2] += len(goldSpans)
+        counts[3] += len(predSpans)
+        counts[4] += len(goldSpans & predSpans)
+        for (s, e) in goldSpans:
+            if text[s:e] not in _vocab:
+                counts[5] += 1
+                if (s, e) in predSpans:
+                    counts[6] += 1
+    return counts
+
+
+def evaluate(name, corpus, vocab, split, workers=2, chunkSize=500, emissionBudget=None, dtype="f", goldPath=None):
+    """
+    评测一个分词器，工作进程各自映射语料缓存，进程间只传递句子下标
+    :param name: 分词器名
+    :param corpus: 标准答案语料缓存
+    :param vocab: 训练词表
+    :param split: 是否按行号划分测试集
+    :param workers: 进程数
+    :param chunkSize: 每批的句子数
+    :param emissionBudget: HMM发射概率表的内存预算
+    :param dtype: HMM发射概率表的存储类型
+    :param goldPath: 标准答案语料路径，工作进程从这里加载语料缓存，默认是加载corpus时传入的路径
+    :return: 评测结果
+    """
+    goldPath = goldPath or corpus.sourcePath
+    indexes = [i for i in range(len(corpus)) if isTest(i, split)]
+    chunks = [indexes[i: i + chunkSize] for i in range(0, len(indexes), chunkSize)]
+    total = [0, 0, 0, 0, 0, 0, 0, 0.0]
+    begin = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                             initargs=(name, vocab, goldPath, emissionBudget, dtype)) as executor:
+        for counts in executor.map(evaluateChunk, chunks):
+            total = [a + b for a, b in zip(total, counts)]
+    wall = time.perf_counter() - begin
+    sentences, chars, gold, pred, correct, oov, oovCorrect, segSeconds = total
+    precision = correct * 1.0 / pred if pred else 0.0
+    recall = correct * 1.0 / gold if gold else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "segmenter": name,
+        "sentences": sentences,
+        "chars": chars,
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(f1, 4),
+        "oovRecall": round(oovCorrect * 1.0 / oov, 4) if oov else None,
+        "oovRate": round(oov * 1.0 / gold, 4) if gold else None,
+        # 单进程的切分速度，及包含进程调度在内的整体速度
+        "charsPerSec": round(chars / segSeconds, 1) if segSeconds else 0.0,
+        "wallCharsPerSec": round(chars / wall, 1) if wall else 0.0,
+        "wallSeconds": round(wall, 3),
+    }
+
+
+def currentRssKb():
+    """
+    当前进程的常驻内存，单位KB。没有/proc时退化为峰值内存
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _measureModel(emissionBudget, dtype, samples):
+    """
+    在新进程中加载HMM模型并切分几句话，统计模型带来的常驻内存增量
+    :return: (内存增量KB, 发射概率表的信息)
+    """
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    from MatchByStatistics import HMM
+    hmm = HMM(os.path.join(BASE_DIR, "data", "trainingSet.txt"))
+    before = currentRssKb()
+    hmm.loadModel(emissionBudget, dtype)
+    for text in samples:
+        hmm.cutSpans(text)
+    rssKb = currentRssKb() - before
+    if emissionBudget is None:
+        return rssKb, {"denseChars": len(set().union(*hmm.emitP.values())), "tableBytes": None}
+    return rssKb, {"denseChars": hmm.emitP.nDense, "tableBytes": hmm.emitP.nbytes()}
+
+
+def evaluateBudgets(budgets, corpus, vocab, split, workers=2, chunkSize=500, dtype="f", goldPath=None):
+    """
+    评测HMM在不同发射概率内存预算下的效果和内存
+    :param budgets: 预算列表，None表示使用完整的嵌套字典
+    :param dtype: 发射概率表的存储类型
+    :param goldPath: 标准答案语料路径
+    :return: 每个预算的评测结果
+    """
+    from MatchByStatistics import HMM
+    samples = ["".join(corpus.words(i)) for i in range(min(200, len(corpus)))]
+    results = []
+    for budget in budgets:
+        if budget is not None:
+            # 先在当前进程中压缩并保存，评测时只是加载
+            HMM(os.path.join(BASE_DIR, "data", "trainingSet.txt")).loadModel(budget, dtype)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            rssKb, table = executor.submit(_measureModel, budget, dtype, samples).result()
+        res = evaluate("HMM", corpus, vocab, split, workers, chunkSize, budget, dtype, goldPath)
+        res.update(table)
+        res.update({"emissionBudget": budget, "dtype": dtype, "modelRssKb": rssKb})
+        results.append(res)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="segmentation evaluation against a gold corpus")
+    parser.add_argument("--segmenters", nargs="+", default=SEGMENTERS, choices=SEGMENTERS)
+    parser.add_argument("--gold", default=os.path.join(BASE_DIR, "data", "t.txt"))
+    parser.add_argument("--train", default=None, help="vocabulary corpus, defaults to the non-test lines of --gold")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=500)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--emission-budgets", nargs="+", default=None,
+                        help="evaluate HMM at each emission table budget in bytes, 'full' for the plain dict model")
+    parser.add_argument("--emission-dtype", default="f", choices=["f", "e"], help="f: float32, e: float16")
+    args = parser.parse_args(argv)
+
+    split = args.train is None
+    corpus = CorpusCache.load(args.gold)
+    vocab = buildVocab(corpus if split else CorpusCache.load(args.train), split)
+    if args.emission_budgets is not None:
+        budgets = [None if b == "full" else int(b) for b in args.emission_budgets]
+        results = evaluateBudgets(budgets, corpus, vocab, split, args.workers, args.chunk, args.emission_dtype,
+                                  args.gold)
+        print("{0:<10}{1:>8}{2:>12}{3:>12}{4:>8}{5:>8}{6:>8}{7:>14}".format(
+            "budget", "chars", "table KB", "model KB", "P", "R", "F1", "chars/s"))
+        for res in results:
+            tableKb = "-" if res["tableBytes"] is None else "{0:.1f}".format(res["tableBytes"] / 1024.0)
+            print("{0:<10}{1:>8}{2:>12}{3:>12}{4:>8.4f}{5:>8.4f}{6:>8.4f}{7:>14.1f}".format(
+                str(res["emissionBudget"] or "full"), res["denseChars"], tableKb, res["modelRssKb"],
+                res["precision"], res["recall"], res["f1"], res["charsPerSec"]))
+    else:
+        results = []
+        print("{0:<6}{1:>8}{2:>8}{3:>8}{4:>10}{5:>14}{6:>14}".format("", "P", "R", "F1", "OOV-R", "chars/s", "wall chars/s"))
+        for name in args.segmenters:
+            res = evaluate(name, corpus, vocab, split, args.workers, args.chunk, goldPath=args.gold)
+            results.append(res)
+            print("{0:<6}{1:>8.4f}{2:>8.4f}{3:>8.4f}{4:>10}{5:>14.1f}{6:>14.1f}".format(
+                name, res["precision"], res["recall"], res["f1"], str(res["oovRecall"]),
+                res["charsPerSec"], res["wallCharsPerSec"]))
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
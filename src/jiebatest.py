@@ -1,8 +1,8 @@
-import jieba
-import os
+from lib import jiebaloader, keywords
 
 """
 基于jieba库的高频词提取。先使用jieba分词，再统计词频并去掉停用词，找到次品最高的几个词
+TF-IDF和TextRank方式的关键词提取见lib.keywords
 """
 class TF:
     def __init__(self, contentPath, stopWordsPath=""):
@@ -14,6 +14,10 @@ class TF:
         self.contentPath = contentPath
         # 停用词路径
         self.stopWordsPath = stopWordsPath
+        # 停用词集合，第一次使用时加载
+        self._stopWords = None
+        # 关键词提取器，第一次使用时构造
+        self._extractor = None
         self._loadContent()
 
     def _loadContent(self):
@@ -26,12 +30,20 @@ class TF:
                 line = line.strip()
                 self._originContent += line
 
+    def setContent(self, content):
+        """
+        直接设置待切分的文本，替换从文件中加载的内容
+        :param content: 待切分的文本
+        :return: void
+        """
+        self._originContent = content
+
     def _cut(self):
         """
         分词
         :return: void
         """
-        self._cutResult = jieba.cut(self._originContent)
+        self._cutResult = jiebaloader.getJieba().cut(self._originContent)
 
     def getCut(self):
         """
@@ -67,12 +79,7 @@ class TF:
         :return: 前topK个高频词
         """
         self._cut()
-        stopWords = []
-        if os.path.exists(self.stopWordsPath):
-            with open(self.stopWordsPath, "r", encoding="utf8") as f:
-                for line in f:
-                    line = line.strip()
-                    stopWords.append(line)
+        stopWords = self.getStopWords()
         wordsDic = {}
         for words in self._cutResult:
             wordsDic[words] = wordsDic.get(words, 0) + 1
@@ -85,9 +92,34 @@ class TF:
                 res.append((k, v))
         return res
 
+    def getStopWords(self):
+        """
+        拿到停用词集合，只在第一次调用时读取文件
+        :return: 停用词集合
+        """
+        if self._stopWords is None:
+            self._stopWords = keywords.loadStopWords(self.stopWordsPath)
+        return self._stopWords
+
+    def getKeywords(self, topK=10, mode="tfidf", idfTable=None):
+        """
+        提取关键词，只分一次词
+        :param topK: 前topK个关键词
+        :param mode: tf、tfidf或textrank
+        :param idfTable: 逆文档频率表，tfidf方式使用，默认从data/t.txt构建
+        :return: (关键词, 得分)的列表
+        """
+        if self._extractor is None:
+            self._extractor = keywords.KeywordExtractor(stopWords=self.getStopWords())
+        if mode == "tfidf" and (idfTable is not None or self._extractor.idf is None):
+            self._extractor.idf = idfTable if idfTable is not None else keywords.IdfTable.fromCorpus("data/t.txt")
+        return self._extractor.extractWords(list(self.getCut()), topK, mode)
+
 
 if __name__ == '__main__':
     tf = TF("data/news.txt", stopWordsPath="data/stopWords.txt")
     print(tf.getTF())
     print(tf.getTFWithStopWords())
+    print(tf.getKeywords(mode="tfidf"))
+    print(tf.getKeywords(mode="textrank"))
 
@@ -0,0 +1,324 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+"""
+语料的整数编码缓存。HMM训练、NER语料处理和评测每次运行都要重新读取、切分几MB的UTF-8文本，这里把语料一次性转化为二进制缓存：
+字的id存为uint32数组，句子在字数组中的起始下标存为uint32数组，每一列标签（状态标注、词性等）的id存为uint8数组。
+之后的运行直接用mmap映射缓存文件，各个数组都是零拷贝的memoryview，不再解析文本。
+
+缓存文件与源文件放在一起，名字是源文件名加_cache。缓存头中记录了源文件的sha1、解析方式和列名，任意一个对不上都会重新构建。
+
+文件结构：魔数NLPC | 版本(uint32) | 头长度(uint32) | 头(json) | 字id数组 | 句子下标数组 | 各列标签数组，每个数组按8字节对齐。
+"""
+
+MAGIC = b"NLPC"
+VERSION = 2
+_PREFIX = struct.Struct("<4sII")
+# 缓存头中必须有的字段，缺少任意一个都视为不可用，重新构建
+_HEADER_KEYS = ("kind", "sourcePath", "columns", "sha1", "byteorder", "nChars", "nSentences", "vocab", "labels",
+                "sourceLines")
+
+
+def fileSha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _pad(n):
+    return (8 - n % 8) % 8
+
+
+def parseGold(f):
+    """
+    解析空格分隔的分词语料，每个字标注BMES状态
+    :param f: 文件对象或行的迭代器
+    :return: (字列表, {"tag": 状态列表})的生成器
+    """
+    for line in f:
+        words = line.split()
+        if not words:
+            continue
+        chars = []
+        tags = []
+        for w in words:
+            chars.extend(w)
+            if len(w) == 1:
+                tags.append("S")
+            else:
+                tags.extend(["B"] + ["M"] * (len(w) - 2) + ["E"])
+        yield chars, {"tag": tags}
+
+
+def columnParser(columns):
+    """
+    解析每行一个字、以空白分隔若干列标签、空行分句的语料（如CRF++的训练集、测试结果）
+    :param columns: 第一列之后每一列的列名
+    :return: 解析函数
+    """
+    def parse(f):
+        chars = []
+        values = {c: [] for c in columns}
+        for line in f:
+            items = line.split()
+            if not items:
+                if chars:
+                    yield chars, values
+                    chars = []
+                    values = {c: [] for c in columns}
+                continue
+            chars.append(items[0])
+            for c, v in zip(columns, items[1:]):
+                values[c].append(v)
+        if chars:
+            yield chars, values
+    return parse
+
+
+class CorpusCache(object):
+    def __init__(self, path, header, buffer):
+        # 缓存文件路径
+        self.path = path
+        # 源文件路径，load时改为调用方传入的路径，缓存头中记录的是构建时的路径，目录移动之后就不对了
+        self.sourcePath = header["sourcePath"]
+        # 缓存头
+        self.header = header
+        # 字表，下标就是字的id
+        self.vocab = header["vocab"]
+        # 每一列的标签表，key是列名，value是标签列表，下标就是标签的id
+        self.labels = header["labels"]
+        # 源文件的总行数，包括空行
+        self.sourceLines = header["sourceLines"]
+        self._mmap = buffer
+        self._view = view = memoryview(buffer)
+        pos = header["dataOffset"]
+        nChars, nSentences = header["nChars"], header["nSentences"]
+        # 字id数组
+        self.charIds = view[pos: pos + nChars * 4].cast("I")
+        pos += nChars * 4 + _pad(nChars * 4)
+        # 句子起始下标数组，长度是句子数+1
+        self.offsets = view[pos: pos + (nSentences + 1) * 4].cast("I")
+        pos += (nSentences + 1) * 4 + _pad((nSentences + 1) * 4)
+        self._columns = {}
+        for c in header["columns"]:
+            self._columns[c] = view[pos: pos + nChars]
+            pos += nChars + _pad(nChars)
+
+    def __len__(self):
+        return self.header["nSentences"]
+
+    def column(self, name):
+        """
+        拿到一列标签的id数组
+        :param name: 列名
+        :return: uint8的memoryview
+        """
+        return self._columns[name]
+
+    def sentence(self, i):
+        """
+        拿到第i句
+        :param i: 句子下标
+        :return: 字列表和{列名: 标签列表}
+        """
+        begin, end = self.offsets[i], self.offsets[i + 1]
+        chars = [self.vocab[c] for c in self.charIds[begin:end]]
+        values = {}
+        for c, col in self._columns.items():
+            labels = self.labels[c]
+            values[c] = [labels[t] for t in col[begin:end]]
+        return chars, values
+
+    def text(self, i):
+        """
+        第i句的文本
+        :param i: 句子下标
+        :return: 字符串
+        """
+        vocab = self.vocab
+        return "".join([vocab[c] for c in self.charIds[self.offsets[i]: self.offsets[i + 1]]])
+
+    def spans(self, i, column="tag"):
+        """
+        按BMES状态标注得到第i句中每个词的位置，直接比较标签id，不拼接字符串，切分方式与words一致
+        :param i: 句子下标
+        :param column: 状态标注所在的列
+        :return: (开始下标, 结束下标)的列表，下标相对于句首
+        """
+        begin, end = self.offsets[i], self.offsets[i + 1]
+        labels = self.labels[column]
+        starts = {t for t, label in enumerate(labels) if label == "B" or label == "S"}
+        ends = {t for t, label in enumerate(labels) if label == "E" or label == "S"}
+        col = self._columns[column]
+        res = []
+        start = 0
+        for index, t in enumerate(col[begin:end]):
+            if t in starts:
+                if start < index:
+                    res.append((start, index))
+                start = index
+            if t in ends:
+                res.append((start, index + 1))
+                start = index + 1
+        if start < end - begin:
+            res.append((start, end - begin))
+        return res
+
+    def words(self, i, column="tag"):
+        """
+        按BMES状态标注把第i句还原为词列表
+        :param i: 句子下标
+        :param column: 状态标注所在的列
+        :return: 词列表
+        """
+        begin, end = self.offsets[i], self.offsets[i + 1]
+        labels = self.labels[column]
+        col = self._columns[column]
+        vocab, charIds = self.vocab, self.charIds
+        res = []
+        start = begin
+        for index in range(begin, end):
+            tag = labels[col[index]]
+            if tag == "B" or tag == "S":
+                if start < index:
+                    res.append("".join(vocab[c] for c in charIds[start:index]))
+                start = index
+            if tag == "E" or tag == "S":
+                res.append("".join(vocab[c] for c in charIds[start:index + 1]))
+                start = index + 1
+        if start < end:
+            res.append("".join(vocab[c] for c in charIds[start:end]))
+        return res
+
+    def close(self):
+        self.charIds.release()
+        self.offsets.release()
+        for col in self._columns.values():
+            col.release()
+        self._view.release()
+        self._mmap.close()
+
+    @classmethod
+    def build(cls, sourcePath, kind, parser, columns, cachePath=None):
+        """
+        解析源文件并写入缓存
+        :param sourcePath: 源文件路径
+        :param kind: 解析方式的名字，用于判断缓存是否可用
+        :param parser: 解析函数，输入行的迭代器，返回(字列表, {列名: 标签列表})的生成器
+        :param columns: 列名列表
+        :param cachePath: 缓存路径，默认是源文件名加_cache
+        :return: 缓存路径
+        """
+        cachePath = cachePath or sourcePath + "_cache"
+        sourceLines = [0]  # 源文件总行数，HMM训练时用来保持与直接读取文本时相同的初始概率
+
+        def countLines(f):
+            for line in f:
+                sourceLines[0] += 1
+                yield line
+
+        charIds = array("I")
+        offsets = array("I", [0])
+        colIds = {c: array("B") for c in columns}
+        charMap = {}
+        labelMaps = {c: {} for c in columns}
+        sentences = 0
+        with open(sourcePath, encoding="utf8") as f:
+            for chars, values in parser(countLines(f)):
+                for ch in chars:
+                    cid = charMap.get(ch)
+                    if cid is None:
+                        cid = charMap[ch] = len(charMap)
+                    charIds.append(cid)
+                for c in columns:
+                    labelMap = labelMaps[c]
+                    col = colIds[c]
+                    for v in values[c]:
+                        tid = labelMap.get(v)
+                        if tid is None:
+                            tid = labelMap[v] = len(labelMap)
+                            if tid > 255:
+                                raise ValueError("column {0} has more than 256 labels".format(c))
+                        col.append(tid)
+                    assert len(col) == len(charIds)
+                offsets.append(len(charIds))
+                sentences += 1
+        header = {
+            "kind": kind,
+            "sourcePath": sourcePath,
+            "columns": list(columns),
+            "sha1": fileSha1(sourcePath),
+            "byteorder": sys.byteorder,
+            "nChars": len(charIds),
+            "nSentences": sentences,
+            "vocab": sorted(charMap, key=charMap.get),
+            "labels": {c: sorted(m, key=m.get) for c, m in labelMaps.items()},
+            "sourceLines": sourceLines[0],
+        }
+        headerBytes = json.dumps(header, ensure_ascii=False).encode("utf8")
+        headerBytes += b" " * _pad(_PREFIX.size + len(headerBytes))
+        import tempfile  # 只在写文件时需要，不放在模块导入时
+        # 每次构建写自己的临时文件再替换，多个进程同时构建时不会互相干扰
+        fd, tmpPath = tempfile.mkstemp(prefix=os.path.basename(cachePath) + ".",
+                                       dir=os.path.dirname(cachePath) or ".")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(_PREFIX.pack(MAGIC, VERSION, len(headerBytes)))
+                out.write(headerBytes)
+                for arr in [charIds, offsets] + [colIds[c] for c in columns]:
+                    arr.tofile(out)
+                    out.write(b"\0" * _pad(len(arr) * arr.itemsize))
+            os.replace(tmpPath, cachePath)
+        except BaseException:
+            os.remove(tmpPath)
+            raise
+        return cachePath
+
+    @classmethod
+    def _read(cls, cachePath):
+        with open(cachePath, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, headerLength = _PREFIX.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            buffer.close()
+            return None
+        header = json.loads(bytes(buffer[_PREFIX.size: _PREFIX.size + headerLength]).decode("utf8"))
+        if any(key not in header for key in _HEADER_KEYS):
+            buffer.close()
+            return None
+        header["dataOffset"] = _PREFIX.size + headerLength
+        return cls(cachePath, header, buffer)
+
+    @classmethod
+    def load(cls, sourcePath, kind="gold", parser=parseGold, columns=("tag",), cachePath=None):
+        """
+        加载语料缓存，缓存不存在或已经过期时重新构建
+        :param sourcePath: 源文件路径
+        :param kind: 解析方式的名字
+        :param parser: 解析函数
+        :param columns: 列名列表
+        :param cachePath: 缓存路径，默认是源文件名加_cache
+        :return: CorpusCache
+        """
+        cachePath = cachePath or sourcePath + "_cache"
+        if os.path.exists(cachePath):
+            cache = cls._read(cachePath)
+            if cache is not None:
+                header = cache.header
+                if header["kind"] == kind and header["columns"] == list(columns) \
+                        and header["byteorder"] == sys.byteorder and header["sha1"] == fileSha1(sourcePath):
+                    cache.sourcePath = sourcePath
+                    return cache
+                cache.close()
+        cls.build(sourcePath, kind, parser, columns, cachePath)
+        cache = cls._read(cachePath)
+        cache.sourcePath = sourcePath
+        return cache
+
@@ -0,0 +1,169 @@
+import threading
+from contextlib import contextmanager
+
+from lib import instrument
+
+"""
+CRF++模型的调用。NerLocation和NerLocationWithFlag的区别只是模型路径和每个字的特征列，加载模型、逐字添加特征、标注、
+从标注结果中取出地名或概率的过程都在这里。同一个模型在进程中只加载一次，之后每次使用前clear()。
+tagger在各线程间共享，每个tagger有一把锁，从clear()开始直到读完标注结果都持有这把锁，多个线程同时调用时依次使用。
+
+每个字的特征是一个字符串，多列特征之间用制表符分隔，与训练集的列一致（最后一列标签除外）。
+"""
+
+_TAGGERS = {}  # 已加载的CRF模型，key是加载参数，value是(tagger, 锁)
+_loadLock = threading.Lock()
+
+
+class CRFTagger(object):
+    def __init__(self, modelPath, vlevel=3, nbest=2):
+        """
+        :param modelPath: 模型路径
+        :param vlevel: CRF++的-v，2及以上才能取到每个字的边缘概率
+        :param nbest: CRF++的-n，默认的N-best数
+        """
+        self.modelPath = modelPath
+        self.nbest = nbest
+        self.arg = "-m {0} -v {1} -n{2}".format(modelPath, vlevel, nbest)
+
+    def _shared(self):
+        """
+        拿到CRF模型及其锁，同一个模型只加载一次
+        :return: (tagger, 锁)
+        """
+        entry = _TAGGERS.get(self.arg)
+        if entry is None:
+            with _loadLock:
+                entry = _TAGGERS.get(self.arg)
+                if entry is None:
+                    import CRFPP
+                    instrument.incr("crf.tagger.loads")
+                    with instrument.timer("crf.load"):
+                        entry = (CRFPP.Tagger(self.arg), threading.Lock())
+                    _TAGGERS[self.arg] = entry
+                    return entry
+        instrument.incr("crf.tagger.hits")
+        return entry
+
+    @contextmanager
+    def acquire(self):
+        """
+        独占共享的tagger，在with块内添加特征、标注并读出结果，其他线程要等到with块结束
+        :return: 已经clear()的tagger
+        """
+        tagger, lock = self._shared()
+        with lock:
+            tagger.clear()
+            yield tagger
+
+    @staticmethod
+    def parse(tagger, rows):
+        """
+        逐字添加特征并标注，需要在acquire()的with块内调用
+        :param tagger: acquire()得到的tagger
+        :param rows: 每个字的特征
+        :return: 已完成标注的tagger
+        """
+        count = 0
+        for row in rows:
+            tagger.add(row)
+            count += 1
+        instrument.incr("crf.chars", count)
+        with instrument.timer("crf.parse"):
+            tagger.parse()
+        return tagger
+
+    def locations(self, rows):
+        """
+        标注并拼接出地名
+        :param rows: 每个字的特征
+        :return: 地名列表
+        """
+        with self.acquire() as tagger:
+            return collectLocations(self.parse(tagger, rows))
+
+    def spans(self, rows):
+        """
+        标注并找到地名的位置
+        :param rows: 每个字的特征
+        :return: (开始下标, 结束下标)的列表
+        """
+        with self.acquire() as tagger:
+            return collectSpans(self.parse(tagger, rows))
+
+    def nbestSpans(self, rows, n=2):
+        """
+        前n个标注序列对应的地名位置，由CRF++的A*搜索逐个给出
+        :param rows: 每个字的特征
+        :param n: 标注序列数
+        :return: [(标注序列的条件概率, (开始下标, 结束下标)的列表)]，按概率从大到小排列
+        """
+        with self.acquire() as tagger:
+            tagger.set_nbest(n)
+            try:
+                self.parse(tagger, rows)
+                res = []
+                for _ in range(n):
+                    if not tagger.next():
+                        break
+                    res.append((tagger.prob(), collectSpans(tagger)))
+                return res
+            finally:
+                # tagger是共享的，恢复加载时的-n
+                tagger.set_nbest(self.nbest)
+
+    def confidence(self, rows):
+        """
+        最优标注序列中每个字的标签及其边缘概率
+        :param rows: 每个字的特征
+        :return: [(标签, 边缘概率)]
+        """
+        with self.acquire() as tagger:
+            self.parse(tagger, rows)
+            return [(tagger.y2(i), tagger.prob(i)) for i in range(tagger.size())]
+
+
+def collectSpans(tagger):
+    """
+    从标注结果中找到地名的位置，地名是连续的一段字，不完整的标注序列（如没有B的M、E）从第一个M或E开始
+    :param tagger: 已完成标注的tagger
+    :return: (开始下标, 结束下标)的列表
+    """
+    res = []
+    begin = None
+    for i in range(tagger.size()):
+        tag = tagger.y2(i)
+        if tag == "O":
+            begin = None
+            continue
+        if tag == "B" or tag == "S" or begin is None:
+            begin = i
+        if tag == "E" or tag == "S":
+            res.append((begin, i + 1))
+            begin = None
+    return res
+
+
+def collectLocations(tagger):
+    """
+    从标注结果中拼接出地名
+    :param tagger: 已完成标注的tagger
+    :return: 地名列表
+    """
+    res = []
+    builder = ""
+    for i in range(tagger.size()):
+        for j in range(tagger.xsize()):
+            ch = tagger.x(i, j)
+            tag = tagger.y2(i)
+            if tag == "B":
+                builder = ch
+            elif tag == "M":
+                builder += ch
+            elif tag == "E":
+                builder += ch
+                res.append(builder)
+            elif tag == "S":
+                builder = ch
+                res.append(builder)
+    return res
@@ -0,0 +1,138 @@
+import threading
+
+"""
+可热更新的词表。词表的每个版本是一个不可变的快照（frozenset及最大词长），更新时复制当前快照，在后台线程中应用增删之后
+构建新的快照，最后一次赋值替换掉旧快照。读的一方（MM、RMM、BMM的cut）在切分开始时取一次快照，之后一直使用这个快照，
+正在进行的切分不受更新影响，读路径上不需要加锁；写的一方之间用锁串行。
+
+增量文件每行一个词：以+开头或没有前缀表示增加，以-开头表示删除，#开头的行是注释。
+"""
+
+
+class DictSnapshot(object):
+    __slots__ = ("words", "maxLength", "version")
+
+    def __init__(self, words, version):
+        # 词表
+        self.words = frozenset(words)
+        # 词的最大长度
+        self.maxLength = max(len(w) for w in self.words) if self.words else 1
+        # 版本号，每次更新加1
+        self.version = version
+
+
+class DictionaryStore(object):
+    def __init__(self, words=()):
+        self._snapshot = DictSnapshot(words, 0)
+        self._writeLock = threading.Lock()
+        self._executor = None
+
+    def current(self):
+        """
+        拿到当前的快照，不加锁
+        :return: DictSnapshot
+        """
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def update(self, adds=(), removes=()):
+        """
+        复制当前快照，应用增删后替换为新快照
+        :param adds: 增加的词
+        :param removes: 删除的词
+        :return: 新快照
+        """
+        with self._writeLock:
+            old = self._snapshot
+            words = set(old.words)
+            words.difference_update(removes)
+            words.update(adds)
+            snapshot = DictSnapshot(words, old.version + 1)
+            self._snapshot = snapshot
+        return snapshot
+
+    def replace(self, words):
+        """
+        整体替换词表
+        :param words: 新词表
+        :return: 新快照
+        """
+        with self._writeLock:
+            snapshot = DictSnapshot(words, self._snapshot.version + 1)
+            self._snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def readPatch(path):
+        """
+        读取增量文件
+        :param path: 文件路径
+        :return: 增加的词和删除的词
+        """
+        adds, removes = [], []
+        with open(path, encoding="utf8") as f:
+            for line in f:
+                line = line.strip()
+                if line == "" or line.startswith("#"):
+                    continue
+                if line.startswith("-"):
+                    removes.append(line[1:].strip())
+                elif line.startswith("+"):
+                    adds.append(line[1:].strip())
+                else:
+                    adds.append(line)
+        return adds, removes
+
+    def applyPatch(self, path):
+        """
+        从增量文件更新词表
+        :param path: 文件路径
+        :return: 新快照
+        """
+        adds, removes = self.readPatch(path)
+        return self.update(adds, removes)
+
+    def applyPatchAsync(self, path):
+        """
+        在后台线程中从增量文件更新词表
+        :param path: 文件路径
+        :return: Future，结果是新快照
+        """
+        # 只有热更新时才需要，concurrent.futures会连带导入logging，不放在模块导入时
+        from concurrent.futures import ThreadPoolExecutor
+        # 只能有一个后台线程，增量按提交的顺序应用
+        with self._writeLock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            return self._executor.submit(self.applyPatch, path)
+
+    @classmethod
+    def fromFile(cls, path):
+        """
+        从词表文件构建，每行第一列是词
+        :param path: 文件路径
+        :return: DictionaryStore
+        """
+        words = []
+        with open(path, encoding="utf8") as f:
+            for line in f:
+                items = line.split()
+                if items:
+                    words.append(items[0])
+        return cls(words)
+
+
+def snapshotOf(dictionary, maxLength):
+    """
+    拿到本次切分使用的词表和最大词长。dictionary是DictionaryStore时取当前快照，否则原样返回
+    :param dictionary: 词表或DictionaryStore
+    :param maxLength: 词表中词的最大长度
+    :return: 词表和最大词长
+    """
+    if isinstance(dictionary, DictionaryStore):
+        snapshot = dictionary.current()
+        return snapshot.words, snapshot.maxLength
+    return dictionary, maxLength
@@ -0,0 +1,254 @@
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import unicodedata
+from array import array
+
+"""
+按内存预算压缩的HMM发射概率表。HMM.emitP是 状态 -> {字: 概率} 的嵌套字典，每个字在每个状态下都是一个独立的float对象。
+这里把所有字按码位排序存为uint32数组，查找时二分；出现频率高的字各占一行，每行是各状态下发射概率的对数，
+以float32（"f"）或float16（"e"）连续存放；预算放不下的低频字按类别（数字、拉丁字母、标点符号、低频汉字、其他）合并，
+同一类别的字共用一行，概率取类别内各字的平均值。对数存放是因为发射概率通常在1e-6左右，低于float16能精确表示的范围。
+
+表可以连同初始概率、转移概率一起保存为一个文件，加载时用mmap映射，不需要反序列化出任何字典。数组按本机字节序存放，
+头中记录了字节序，与本机不一致时视为不可用。
+
+文件结构：魔数NLPE | 版本(uint32) | 头长度(uint32) | 头(json) | 码位数组(uint32) | 行号数组(uint32) | 概率数据，每段按8字节对齐。
+"""
+
+MAGIC = b"NLPE"
+VERSION = 1
+_PREFIX = struct.Struct("<4sII")
+
+# 低频字的类别
+CLASSES = ("digit", "latin", "punct", "cjk", "other")
+DTYPES = ("f", "e")
+
+
+def _pad(n):
+    return (8 - n % 8) % 8
+
+
+def _log(p):
+    return math.log(p) if p > 0 else float("-inf")
+
+
+def charClass(ch):
+    """
+    低频字的类别
+    :param ch: 字
+    :return: CLASSES中的下标
+    """
+    category = unicodedata.category(ch)
+    if category[0] == "N":
+        return 0
+    if category == "Lo":  # 汉字、假名、谚文等没有大小写的文字
+        return 3
+    if category[0] == "L":
+        return 1
+    if category[0] in "PSZ":
+        return 2
+    return 4
+
+
+class EmissionTable(object):
+    def __init__(self, header, buffer):
+        # 状态列表，每行按这个顺序存放各状态的概率
+        self.states = header["states"]
+        # 概率的存储类型，f是float32，e是float16
+        self.dtype = header["dtype"]
+        # 独占一行的字数
+        self.nDense = header["nDense"]
+        # 头，除上面的信息之外还有初始概率startP、转移概率transP
+        self.header = header
+        self._buffer = buffer
+        self._view = view = memoryview(buffer)
+        pos = header["dataOffset"]
+        nCodes = header["nCodes"]
+        # 所有出现过的字的码位，从小到大排列
+        self._codes = view[pos: pos + nCodes * 4].cast("I")
+        pos += nCodes * 4 + _pad(nCodes * 4)
+        # 每个字对应的行，nDense及之后的行是类别
+        self._rows = view[pos: pos + nCodes * 4].cast("I")
+        pos += nCodes * 4 + _pad(nCodes * 4)
+        self._row = struct.Struct("={0}{1}".format(len(self.states), self.dtype))
+        self._data = view[pos: pos + (self.nDense + len(CLASSES)) * self._row.size]
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __contains__(self, ch):
+        return self._find(ch) >= 0
+
+    def nbytes(self):
+        """
+        码位、行号、概率三个数组占用的字节数
+        """
+        return len(self._codes) * 8 + len(self._data)
+
+    def _find(self, ch):
+        code = ord(ch)
+        codes = self._codes
+        i = bisect.bisect_left(codes, code)
+        if i < len(codes) and codes[i] == code:
+            return self._rows[i]
+        return -1
+
+    def logEmissions(self, ch):
+        """
+        一个字在各状态下发射概率的对数
+        :param ch: 字
+        :return: 按states顺序的元组，没有出现过的字返回None
+        """
+        row = self._find(ch)
+        if row < 0:
+            return None
+        return self._row.unpack_from(self._data, row * self._row.size)
+
+    def emissions(self, ch):
+        """
+        一个字在各状态下的发射概率
+        :param ch: 字
+        :return: 按states顺序的list，没有出现过的字返回None
+        """
+        logs = self.logEmissions(ch)
+        if logs is None:
+            return None
+        return [math.exp(x) for x in logs]
+
+    def close(self):
+        self._codes.release()
+        self._rows.release()
+        self._data.release()
+        self._view.release()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    @staticmethod
+    def denseSize(nCodes, budget, nStates=4, dtype="f"):
+        """
+        在预算内最多可以独占一行的字数
+        :param nCodes: 字数
+        :param budget: 内存预算（字节），None表示不限制
+        :param nStates: 状态数
+        :param dtype: 概率的存储类型
+        :return: 字数
+        """
+        if budget is None:
+            return nCodes
+        rowSize = struct.calcsize("={0}{1}".format(nStates, dtype))
+        fixed = nCodes * 8 + len(CLASSES) * rowSize
+        if budget < fixed:
+            raise ValueError("emission budget {0} is below the minimum of {1} bytes".format(budget, fixed))
+        return min(nCodes, (budget - fixed) // rowSize)
+
+    @classmethod
+    def build(cls, emitP, states, budget=None, dtype="f", extra=None):
+        """
+        从HMM.emitP构建
+        :param emitP: 状态 -> {字: 概率}
+        :param states: 状态列表
+        :param budget: 内存预算（字节），None表示所有字都独占一行
+        :param dtype: f是float32，e是float16
+        :param extra: 需要一起保存到头中的其他信息
+        :return: EmissionTable
+        """
+        if dtype not in DTYPES:
+            raise ValueError("unknown dtype {0}, expected one of {1}".format(dtype, DTYPES))
+        chars = set()
+        for s in states:
+            chars.update(emitP[s])
+        # 按各状态下发射概率之和排序，高频的字独占一行
+        ranked = sorted(chars, key=lambda ch: (-sum(emitP[s].get(ch, 0.0) for s in states), ch))
+        nDense = cls.denseSize(len(ranked), budget, len(states), dtype)
+        rowOf = {}
+        rows = []
+        for ch in ranked[:nDense]:
+            rowOf[ch] = len(rows)
+            rows.append([_log(emitP[s].get(ch, 0.0)) for s in states])
+        # 类别的行：类别内各字概率的平均值
+        sums = [[0.0] * len(states) for _ in CLASSES]
+        sizes = [0] * len(CLASSES)
+        for ch in ranked[nDense:]:
+            c = charClass(ch)
+            rowOf[ch] = nDense + c
+            sizes[c] += 1
+            for k, s in enumerate(states):
+                sums[c][k] += emitP[s].get(ch, 0.0)
+        for c in range(len(CLASSES)):
+            rows.append([_log(p / sizes[c]) if sizes[c] else float("-inf") for p in sums[c]])
+        codes = sorted(ord(ch) for ch in chars)
+        header = dict(extra or {})
+        header.update({
+            "states": list(states),
+            "dtype": dtype,
+            "budget": budget,
+            "nDense": nDense,
+            "nCodes": len(codes),
+            "classes": list(CLASSES),
+            "classSizes": sizes,
+            "byteorder": sys.byteorder,
+        })
+        rowFormat = struct.Struct("={0}{1}".format(len(states), dtype))
+        data = b"".join(rowFormat.pack(*r) for r in rows)
+        codeArray = array("I", codes)
+        rowArray = array("I", [rowOf[chr(c)] for c in codes])
+        headerBytes = json.dumps(header, ensure_ascii=False).encode("utf8")
+        headerBytes += b" " * _pad(_PREFIX.size + len(headerBytes))
+        parts = [_PREFIX.pack(MAGIC, VERSION, len(headerBytes)), headerBytes]
+        for arr in (codeArray, rowArray):
+            parts.append(arr.tobytes())
+            parts.append(b"\0" * _pad(len(arr) * 4))
+        parts.append(data)
+        return cls.fromBytes(b"".join(parts))
+
+    @classmethod
+    def fromBytes(cls, buffer):
+        """
+        从build的结果或映射的文件构造
+        :param buffer: bytes或mmap
+        :return: EmissionTable，格式或字节序不对时返回None
+        """
+        magic, version, headerLength = _PREFIX.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            return None
+        header = json.loads(bytes(buffer[_PREFIX.size: _PREFIX.size + headerLength]).decode("utf8"))
+        if header["byteorder"] != sys.byteorder:
+            return None
+        header["dataOffset"] = _PREFIX.size + headerLength
+        return cls(header, buffer)
+
+    def save(self, path):
+        """
+        保存到文件，先写临时文件再替换，每次保存的临时文件不同，多个进程同时保存时不会互相干扰
+        :param path: 文件路径
+        :return: 文件路径
+        """
+        import tempfile  # 只在写文件时需要，不放在模块导入时
+        fd, tmpPath = tempfile.mkstemp(prefix=os.path.basename(path) + ".", dir=os.path.dirname(path) or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._buffer)
+            os.replace(tmpPath, path)
+        except BaseException:
+            os.remove(tmpPath)
+            raise
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """
+        用mmap映射文件
+        :param path: 文件路径
+        :return: EmissionTable，格式或字节序不对时返回None
+        """
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        table = cls.fromBytes(buffer)
+        if table is None:
+            buffer.close()
+        return table
@@ -0,0 +1,238 @@
+import marshal
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+热点路径埋点。按阶段统计耗时（调用次数、总耗时、最大耗时），按名字统计计数（处理字数、未登录字数、缓存命中、模型加载次数等），
+可以导出为Prometheus文本格式，或导出为cProfile/pstats可以直接读取的统计文件。
+
+阶段可以嵌套，每个线程记录当前正在计时的阶段，除总耗时外还统计不含子阶段的自身耗时，以及父阶段到子阶段的调用关系，
+导出为pstats时tottime是自身耗时、cumtime是总耗时，各阶段的tottime相加不会重复计算。
+
+默认关闭，关闭时timer()返回一个共享的空对象，incr()直接返回，几乎没有开销。通过enable()或设置环境变量NLP_INSTRUMENT=1打开。
+
+使用：
+    from lib import instrument
+    with instrument.timer("hmm.viterbi"):
+        ...
+    instrument.incr("hmm.chars", len(text))
+    print(instrument.toPrometheus())
+"""
+
+_enabled = os.environ.get("NLP_INSTRUMENT", "") not in ("", "0")
+_lock = threading.Lock()
+_timers = {}  # key是阶段名，value是[调用次数, 总耗时, 最大耗时, 自身耗时]
+_edges = {}  # key是(父阶段名, 子阶段名)，value是[调用次数, 子阶段的自身耗时, 子阶段的总耗时]
+_local = threading.local()  # stack是当前线程正在计时的阶段
+_counters = {}  # key是计数名，value是计数值
+
+
+class _NullTimer(object):
+    """
+    关闭埋点时使用的空计时器
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class _Timer(object):
+    __slots__ = ("name", "_begin", "_child")
+
+    def __init__(self, name):
+        self.name = name
+        self._begin = 0.0
+        # 子阶段的总耗时
+        self._child = 0.0
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self._begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        seconds = time.perf_counter() - self._begin
+        stack = _local.stack
+        stack.pop()
+        parent = stack[-1] if stack else None
+        if parent is not None:
+            parent._child += seconds
+        _record(self.name, seconds, seconds - self._child, parent.name if parent is not None else None)
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def isEnabled():
+    return _enabled
+
+
+def reset():
+    """
+    清空所有统计
+    :return: void
+    """
+    with _lock:
+        _timers.clear()
+        _edges.clear()
+        _counters.clear()
+
+
+def timer(name):
+    """
+    拿到一个阶段计时器，配合with使用
+    :param name: 阶段名
+    :return: 计时器，关闭埋点时返回空计时器
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def record(name, seconds):
+    """
+    记录一次阶段耗时
+    :param name: 阶段名
+    :param seconds: 耗时，单位秒
+    :return: void
+    """
+    if not _enabled:
+        return
+    _record(name, seconds, seconds, None)
+
+
+def _record(name, seconds, selfSeconds, parent):
+    with _lock:
+        item = _timers.get(name)
+        if item is None:
+            _timers[name] = [1, seconds, seconds, selfSeconds]
+        else:
+            item[0] += 1
+            item[1] += seconds
+            if seconds > item[2]:
+                item[2] = seconds
+            item[3] += selfSeconds
+        if parent is not None:
+            edge = _edges.get((parent, name))
+            if edge is None:
+                _edges[(parent, name)] = [1, selfSeconds, seconds]
+            else:
+                edge[0] += 1
+                edge[1] += selfSeconds
+                edge[2] += seconds
+
+
+def incr(name, n=1):
+    """
+    增加计数
+    :param name: 计数名
+    :param n: 增加的值
+    :return: void
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def snapshot():
+    """
+    拿到当前统计的快照
+    :return: 字典，timers的value是{calls, seconds, maxSeconds, selfSeconds}，
+             edges的key是(父阶段名, 子阶段名)，value是{calls, selfSeconds, seconds}，counters的value是计数值
+    """
+    with _lock:
+        timers = {k: {"calls": v[0], "seconds": v[1], "maxSeconds": v[2], "selfSeconds": v[3]}
+                  for k, v in _timers.items()}
+        edges = {k: {"calls": v[0], "selfSeconds": v[1], "seconds": v[2]} for k, v in _edges.items()}
+        counters = dict(_counters)
+    return {"timers": timers, "edges": edges, "counters": counters}
+
+
+def toPrometheus(prefix="nlp"):
+    """
+    导出为Prometheus文本格式
+    :param prefix: 指标名前缀
+    :return: 文本
+    """
+    snap = snapshot()
+    lines = []
+    stages = sorted(snap["timers"].items())
+    for metric, key, kind in [("stage_calls_total", "calls", "counter"),
+                              ("stage_seconds_total", "seconds", "counter"),
+                              ("stage_self_seconds_total", "selfSeconds", "counter"),
+                              ("stage_seconds_max", "maxSeconds", "gauge")]:
+        name = prefix + "_" + metric
+        lines.append("# TYPE {0} {1}".format(name, kind))
+        for stage, value in stages:
+            lines.append('{0}{{stage="{1}"}} {2}'.format(name, stage, repr(value[key])))
+    name = prefix + "_events_total"
+    lines.append("# TYPE {0} counter".format(name))
+    for event, value in sorted(snap["counters"].items()):
+        lines.append('{0}{{name="{1}"}} {2}'.format(name, event, value))
+    return "\n".join(lines) + "\n"
+
+
+def toPstats():
+    """
+    转化为pstats使用的统计字典，每个阶段作为一个伪函数，key是(文件, 行号, 函数名)，tottime是自身耗时，cumtime是总耗时，
+    嵌套的阶段记录调用它的父阶段
+    :return: 统计字典
+    """
+    snap = snapshot()
+    stats = {}
+    for stage, value in snap["timers"].items():
+        calls = value["calls"]
+        stats[("~nlp", 0, stage)] = (calls, calls, value["selfSeconds"], value["seconds"], {})
+    for (parent, stage), value in snap["edges"].items():
+        callers = stats[("~nlp", 0, stage)][4]
+        callers[("~nlp", 0, parent)] = (value["calls"], value["calls"], value["selfSeconds"], value["seconds"])
+    return stats
+
+
+def dumpStats(path):
+    """
+    把阶段耗时保存为pstats文件，可以通过pstats.Stats(path)读取，也可以用snakeviz等工具查看
+    :param path: 文件路径
+    :return: void
+    """
+    with open(path, "wb") as f:
+        marshal.dump(toPstats(), f)
+
+
+@contextmanager
+def profile(path=None):
+    """
+    使用cProfile对一段代码做完整的函数级剖析
+    :param path: 结果保存路径，为None时不保存
+    :return: cProfile.Profile对象
+    """
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path is not None:
+            profiler.dump_stats(path)
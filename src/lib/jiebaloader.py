@@ -0,0 +1,137 @@
+import io
+import marshal
+import os
+import threading
+
+"""
+jieba的延迟加载。导入jieba本身以及第一次分词时构建前缀词典都要花费数秒，只需要HMM或规则分词的场景完全不需要这部分开销。
+这里把jieba和jieba.posseg的导入推迟到第一次真正使用时，并把jieba的前缀词典缓存放到固定目录（而不是系统临时目录），
+部署时先运行一次 python -m lib.jiebaloader 预先构建缓存，之后每个进程只需要读取缓存。
+jieba.posseg在导入时会再把dict.txt解析一遍得到词性表，这里把词性表缓存在同一目录（所有词和所有词性各自用换行拼成一个字符串，
+再用marshal保存，比直接保存字典读得快），以词典文件的路径、大小、修改时间作为key，导入时只读取缓存。
+
+缓存目录默认是src/data/cache，可以通过环境变量NLP_CACHE_DIR修改。
+"""
+
+CACHE_DIR = os.environ.get("NLP_CACHE_DIR",
+                           os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache"))
+CACHE_FILE = "jieba.cache"
+POS_CACHE_FILE = "posseg.cache"
+
+_lock = threading.Lock()
+_jieba = None
+_posseg = None
+
+
+def getJieba():
+    """
+    拿到jieba模块，第一次调用时导入并设置词典缓存位置
+    :return: jieba模块
+    """
+    global _jieba
+    if _jieba is None:
+        with _lock:
+            if _jieba is None:
+                import jieba
+                jieba.setLogLevel(30)
+                # 多个进程同时冷启动时可能同时创建
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                jieba.dt.tmp_dir = CACHE_DIR
+                jieba.dt.cache_file = CACHE_FILE
+                _jieba = jieba
+    return _jieba
+
+
+def getPosseg():
+    """
+    拿到jieba.posseg模块，第一次调用时导入，词性表在导入时加载
+    :return: jieba.posseg模块
+    """
+    global _posseg
+    if _posseg is None:
+        jieba = getJieba()
+        with _lock:
+            if _posseg is None:
+                _posseg = _importPosseg(jieba)
+    return _posseg
+
+
+def _dictKey(jieba):
+    """
+    词典文件的路径、大小、修改时间，用于判断词性表缓存是否可用
+    """
+    if jieba.dt.dictionary == jieba.DEFAULT_DICT:
+        path = os.path.join(os.path.dirname(os.path.abspath(jieba.__file__)), jieba.DEFAULT_DICT_NAME)
+    else:
+        path = os.path.abspath(jieba.dt.dictionary)
+    st = os.stat(path)
+    return [path, st.st_size, st.st_mtime_ns]
+
+
+def _readPosCache(path, key):
+    """
+    读取词性表缓存
+    :return: 词性表，缓存不存在或key对不上时返回None
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            cacheKey, words, tags = marshal.loads(f.read())
+    except (EOFError, ValueError, TypeError):
+        return None
+    if cacheKey != key:
+        return None
+    return dict(zip(words.split("\n"), tags.split("\n")))
+
+
+def _writePosCache(path, key, wordTagTab):
+    """
+    写入词性表缓存。每个进程写自己的临时文件再替换，多个进程同时写时不会互相干扰
+    """
+    import tempfile  # 只有没有缓存时才需要，不放在模块导入时
+    fd, tmpPath = tempfile.mkstemp(prefix=POS_CACHE_FILE + ".", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(marshal.dumps((key, "\n".join(wordTagTab), "\n".join(wordTagTab.values()))))
+        os.replace(tmpPath, path)
+    except BaseException:
+        os.remove(tmpPath)
+        raise
+
+
+def _importPosseg(jieba):
+    """
+    导入jieba.posseg。有缓存时让模块导入时构造的POSTokenizer读取一个空词典，再换上缓存中的词性表；
+    没有缓存时正常导入，并把解析得到的词性表写入缓存
+    :return: jieba.posseg模块
+    """
+    key = _dictKey(jieba)
+    cachePath = os.path.join(CACHE_DIR, POS_CACHE_FILE)
+    wordTagTab = _readPosCache(cachePath, key)
+    if wordTagTab is None:
+        from jieba import posseg
+        _writePosCache(cachePath, key, posseg.dt.word_tag_tab)
+        return posseg
+    jieba.dt.get_dict_file = lambda: io.BytesIO(b"")
+    try:
+        from jieba import posseg
+    finally:
+        # 删掉实例上的属性，恢复类上的方法
+        del jieba.dt.get_dict_file
+    posseg.dt.word_tag_tab = wordTagTab
+    return posseg
+
+
+def prebuild():
+    """
+    预先加载jieba和词性表，并把前缀词典和词性表写入缓存，用于部署时或在fork工作进程之前调用
+    :return: 缓存文件路径
+    """
+    getJieba().initialize()
+    getPosseg()
+    return os.path.join(CACHE_DIR, CACHE_FILE)
+
+
+if __name__ == '__main__':
+    print("jieba cache -> " + prebuild())
@@ -0,0 +1,345 @@
+import math
+import os
+import threading
+from array import array
+
+from lib import instrument
+from lib.corpuscache import fileSha1
+
+"""
+关键词提取。在jiebatest.TF按词频取前几个词的基础上，增加两种方式：
+    tfidf：词频乘以逆文档频率。逆文档频率表（IdfTable）从data/t.txt这样空格分隔的分词语料中预先统计，保存在磁盘上，
+           新文档到来时可以增量更新文档数和文档频率，提取时每个词只需要查一次表。
+    textrank：在窗口内共现的词之间连边，构造稀疏的转移矩阵（CSR格式，用array保存），用幂迭代求每个词的得分。
+两种方式都只需要对文档分一次词。
+
+逆文档频率表的文件格式：第一行是 #docs<TAB>文档数，第二行是 #source<TAB>构建时语料的sha1，之后每行是 词<TAB>文档频率。
+语料变化之后（sha1对不上）重新构建，此前增量加入的文档随之丢弃。
+"""
+
+DEFAULT_STOP_WORDS = "data/stopWords.txt"
+MODES = ("tf", "tfidf", "textrank")
+
+
+def loadStopWords(path):
+    """
+    读取停用词表，每行一个词
+    :param path: 停用词文件路径，不存在时返回空集合
+    :return: 停用词集合
+    """
+    if not path or not os.path.exists(path):
+        return frozenset()
+    with open(path, encoding="utf8") as f:
+        return frozenset(line.strip() for line in f if line.strip())
+
+
+class IdfTable(object):
+    def __init__(self, df=None, nDocs=0, path=None, sourceSha1=None):
+        # 文档频率，key是词，value是包含这个词的文档数
+        self.df = df if df is not None else {}
+        # 文档总数
+        self.nDocs = nDocs
+        # 保存路径
+        self.path = path
+        # 构建时语料的sha1，不是从语料构建的为None
+        self.sourceSha1 = sourceSha1
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.df)
+
+    def __contains__(self, word):
+        return word in self.df
+
+    def idf(self, word):
+        """
+        平滑的逆文档频率 log((N + 1) / (df + 1)) + 1，没有出现过的词取最大值
+        :param word: 词
+        :return: 逆文档频率
+        """
+        return math.log((self.nDocs + 1.0) / (self.df.get(word, 0) + 1.0)) + 1.0
+
+    def addDocument(self, words):
+        """
+        增量加入一篇文档
+        :param words: 文档的分词结果
+        :return: void
+        """
+        unique = set(words)
+        with self._lock:
+            df = self.df
+            for w in unique:
+                df[w] = df.get(w, 0) + 1
+            self.nDocs += 1
+
+    def addDocuments(self, docs):
+        """
+        增量加入多篇文档
+        :param docs: 分词结果的迭代器
+        :return: 加入的文档数
+        """
+        count = 0
+        for words in docs:
+            self.addDocument(words)
+            count += 1
+        return count
+
+    def save(self, path=None):
+        """
+        保存到磁盘，先写临时文件再替换，读的一方不会读到写了一半的文件
+        :param path: 保存路径，默认是加载或构建时的路径
+        :return: 保存路径
+        """
+        import tempfile  # 只在保存时需要，不放在模块导入时
+        path = path or self.path
+        with self._lock:
+            # 每次保存写自己的临时文件，多个进程同时保存时不会互相干扰
+            fd, tmpPath = tempfile.mkstemp(prefix=os.path.basename(path) + ".", dir=os.path.dirname(path) or ".")
+            try:
+                with os.fdopen(fd, "w", encoding="utf8") as f:
+                    f.write("#docs\t{0}\n".format(self.nDocs))
+                    if self.sourceSha1 is not None:
+                        f.write("#source\t{0}\n".format(self.sourceSha1))
+                    for w, n in self.df.items():
+                        f.write("{0}\t{1}\n".format(w, n))
+                os.replace(tmpPath, path)
+            except BaseException:
+                os.remove(tmpPath)
+                raise
+        self.path = path
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """
+        从磁盘加载
+        :param path: 文件路径
+        :return: IdfTable
+        """
+        df = {}
+        nDocs = 0
+        sourceSha1 = None
+        with open(path, encoding="utf8") as f:
+            for line in f:
+                items = line.rstrip("\n").split("\t")
+                if len(items) != 2:
+                    continue
+                if items[0] == "#docs":
+                    nDocs = int(items[1])
+                elif items[0] == "#source":
+                    sourceSha1 = items[1]
+                else:
+                    df[items[0]] = int(items[1])
+        return cls(df, nDocs, path, sourceSha1)
+
+    @classmethod
+    def build(cls, corpusPath, path=None, linesPerDoc=1):
+        """
+        从空格分隔的分词语料统计文档频率并保存
+        :param corpusPath: 语料路径
+        :param path: 保存路径，默认是语料文件名加_idf
+        :param linesPerDoc: 每多少行作为一篇文档
+        :return: IdfTable
+        """
+        table = cls(path=path or corpusPath + "_idf", sourceSha1=fileSha1(corpusPath))
+        words = []
+        lines = 0
+        with open(corpusPath, encoding="utf8") as f:
+            for line in f:
+                words.extend(line.split())
+                lines += 1
+                if lines % linesPerDoc == 0 and words:
+                    table.addDocument(words)
+                    words = []
+        if words:
+            table.addDocument(words)
+        table.save()
+        return table
+
+    @classmethod
+    def fromCorpus(cls, corpusPath, path=None, linesPerDoc=1):
+        """
+        加载语料对应的逆文档频率表，不存在或语料已经变化时从语料构建
+        :param corpusPath: 语料路径
+        :param path: 保存路径，默认是语料文件名加_idf
+        :param linesPerDoc: 每多少行作为一篇文档
+        :return: IdfTable
+        """
+        path = path or corpusPath + "_idf"
+        if os.path.exists(path):
+            table = cls.load(path)
+            if table.sourceSha1 == fileSha1(corpusPath):
+                return table
+        return cls.build(corpusPath, path, linesPerDoc)
+
+
+class KeywordExtractor(object):
+    def __init__(self, idf=None, stopWords=(), cut=None, window=5, minLength=2):
+        """
+        :param idf: 逆文档频率表，tfidf方式需要
+        :param stopWords: 停用词集合
+        :param cut: 分词函数，输入文本，返回词的迭代器，默认使用jieba
+        :param window: textrank的共现窗口大小
+        :param minLength: 候选词的最小长度
+        """
+        self.idf = idf
+        self.stopWords = frozenset(stopWords)
+        self._cut = cut
+        self.window = window
+        self.minLength = minLength
+
+    def cut(self, text):
+        if self._cut is None:
+            from lib import jiebaloader
+            self._cut = jiebaloader.getJieba().cut
+        with instrument.timer("keywords.cut"):
+            return list(self._cut(text))
+
+    def isCandidate(self, word):
+        """
+        是否作为候选关键词：不是停用词，长度足够，并且含有文字或数字
+        """
+        return len(word) >= self.minLength and word not in self.stopWords and any(ch.isalnum() for ch in word)
+
+    def tf(self, words, topK=10):
+        """
+        按词频提取
+        :param words: 分词结果
+        :param topK: 前topK个词
+        :return: (词, 词频)的列表
+        """
+        counts = {}
+        for w in words:
+            if self.isCandidate(w):
+                counts[w] = counts.get(w, 0) + 1
+        return sorted(counts.items(), key=lambda x: x[1], reverse=True)[0: topK]
+
+    def tfidf(self, words, topK=10):
+        """
+        按词频乘以逆文档频率提取
+        :param words: 分词结果
+        :param topK: 前topK个词
+        :return: (词, 得分)的列表
+        """
+        if self.idf is None:
+            raise ValueError("tfidf needs an IdfTable")
+        counts = {}
+        total = 0
+        for w in words:
+            if self.isCandidate(w):
+                counts[w] = counts.get(w, 0) + 1
+                total += 1
+        idf = self.idf.idf
+        scores = [(w, n * idf(w) / total) for w, n in counts.items()]
+        return sorted(scores, key=lambda x: x[1], reverse=True)[0: topK]
+
+    def buildGraph(self, words):
+        """
+        构造共现图的转移矩阵，窗口内的两个候选词之间连一条无向边，边的权重是共现次数
+        :param words: 分词结果
+        :return: 词表，以及CSR格式的矩阵(indptr, indices, data)，第j行是指向j的边，data是边的权重除以起点的出度权重
+        """
+        ids = {}
+        graph = []  # graph[i]是{j: 权重}
+        candidates = [ids.setdefault(w, len(ids)) if self.isCandidate(w) else -1 for w in words]
+        for _ in range(len(ids)):
+            graph.append({})
+        window = self.window
+        for i, a in enumerate(candidates):
+            if a < 0:
+                continue
+            for b in candidates[i + 1: i + window]:
+                if b < 0 or b == a:
+                    continue
+                graph[a][b] = graph[a].get(b, 0) + 1
+                graph[b][a] = graph[b].get(a, 0) + 1
+        outWeight = [sum(edges.values()) for edges in graph]
+        indptr = array("i", [0])
+        indices = array("i")
+        data = array("d")
+        # 无向图，指向j的边就是j的邻边
+        for edges in graph:
+            for i, weight in edges.items():
+                indices.append(i)
+                data.append(weight / outWeight[i])
+            indptr.append(len(indices))
+        vocab = sorted(ids, key=ids.get)
+        return vocab, (indptr, indices, data)
+
+    def textRank(self, words, topK=10, damping=0.85, maxIter=100, tol=1e-6):
+        """
+        TextRank提取，对共现图的转移矩阵做幂迭代
+        :param words: 分词结果
+        :param topK: 前topK个词
+        :param damping: 阻尼系数
+        :param maxIter: 最大迭代次数
+        :param tol: 两次迭代间得分的最大变化小于tol时停止
+        :return: (词, 得分)的列表，得分按最大值归一化
+        """
+        vocab, (indptr, indices, data) = self.buildGraph(words)
+        n = len(vocab)
+        if n == 0:
+            return []
+        base = 1.0 - damping
+        scores = [1.0] * n
+        for iteration in range(maxIter):
+            new = [0.0] * n
+            delta = 0.0
+            for j in range(n):
+                s = 0.0
+                for k in range(indptr[j], indptr[j + 1]):
+                    s += data[k] * scores[indices[k]]
+                s = base + damping * s
+                new[j] = s
+                if abs(s - scores[j]) > delta:
+                    delta = abs(s - scores[j])
+            scores = new
+            if delta < tol:
+                break
+        instrument.incr("keywords.textrank.iterations", iteration + 1)
+        top = max(scores)
+        res = sorted(zip(vocab, (s / top for s in scores)), key=lambda x: x[1], reverse=True)
+        return res[0: topK]
+
+    def extractWords(self, words, topK=10, mode="tfidf"):
+        """
+        从分词结果中提取关键词
+        :param words: 分词结果
+        :param topK: 前topK个词
+        :param mode: tf、tfidf或textrank
+        :return: (词, 得分)的列表
+        """
+        if mode == "tf":
+            return self.tf(words, topK)
+        if mode == "tfidf":
+            return self.tfidf(words, topK)
+        if mode == "textrank":
+            return self.textRank(words, topK)
+        raise ValueError("unknown mode {0}, expected one of {1}".format(mode, MODES))
+
+    def extract(self, text, topK=10, mode="tfidf", update=False):
+        """
+        从文本中提取关键词，只分一次词
+        :param text: 文本
+        :param topK: 前topK个词
+        :param mode: tf、tfidf或textrank
+        :param update: 是否把这篇文档增量加入逆文档频率表
+        :return: (词, 得分)的列表
+        """
+        words = self.cut(text)
+        with instrument.timer("keywords." + mode):
+            res = self.extractWords(words, topK, mode)
+        if update and self.idf is not None:
+            self.idf.addDocument(words)
+        return res
+
+
+if __name__ == '__main__':
+    # 在src目录下运行
+    table = IdfTable.fromCorpus("data/t.txt")
+    print("idf table: {0} words, {1} docs -> {2}".format(len(table), table.nDocs, table.path))
+    extractor = KeywordExtractor(table, loadStopWords(DEFAULT_STOP_WORDS))
+    with open("data/news.txt", encoding="utf8") as f:
+        content = "".join(line.strip() for line in f)
+    for m in MODES:
+        print(m, extractor.extract(content, mode=m))
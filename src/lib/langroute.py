@@ -0,0 +1,151 @@
+import re
+from collections import OrderedDict
+
+"""
+语种识别前置路由。中英文混合的输入如果整段交给中文分词和实体识别，英文和代码部分完全是白白浪费CPU。
+这里先按字符所属的文字体系做快速判断：假名、谚文占比足够高直接认为是日文、韩文，汉字占比足够高直接认为是中文，
+剩下判断不了的再批量交给langid模型；结果按文本缓存。路由时只把文本中的中文片段（连续的汉字、中文标点及其中的数字）
+交给后续的分词或实体识别，不含汉字的文本除非调用方需要语种，否则不做识别。
+
+每个限定了候选语种的LangRouter有自己的langid.langid.LanguageIdentifier，不修改langid模块的全局模型，
+不同候选语种的LangRouter可以共存；不限定语种的共用一个模块级的LanguageIdentifier。
+"""
+
+_CJK = "㐀-䶿一-鿿豈-﫿"
+# 中文片段中可以出现的字符：汉字、中文标点、全角字符、数字
+_CJK_EXT = _CJK + "　-〿＀-￯0-9"
+CJK_CHAR = re.compile("[{0}]".format(_CJK))
+KANA_CHAR = re.compile("[぀-ヿ]")
+HANGUL_CHAR = re.compile("[가-힯ᄀ-ᇿ]")
+WHITESPACE = re.compile("\\s")  # 包括制表符、换行和全角空格
+# 中文片段：可以以数字开头（如2006年），必须包含汉字，中间的空白只有后面紧跟汉字时才算在片段内
+CHINESE_SPAN = re.compile("[0-9]*[{0}](?:[{1}]|\\s+(?=[{0}]))*".format(_CJK, _CJK_EXT))
+
+_identifier = None  # 不限定语种时共用的LanguageIdentifier
+
+
+def _newIdentifier():
+    from langid.langid import LanguageIdentifier, model
+    return LanguageIdentifier.from_modelstring(model)
+
+
+def _getIdentifier():
+    global _identifier
+    if _identifier is None:
+        _identifier = _newIdentifier()
+    return _identifier
+
+
+class LangRouter(object):
+    def __init__(self, zhThreshold=0.5, cacheSize=10000, languages=None, kanaThreshold=0.2):
+        """
+        :param zhThreshold: 汉字在非空白字符中的占比达到该值直接判定为中文
+        :param cacheSize: 缓存的文本数量
+        :param languages: 限定langid的候选语种，为None时使用langid的全部语种
+        :param kanaThreshold: 假名（或谚文）在非空白字符中的占比达到该值直接判定为日文（或韩文），
+                              中文里夹杂的个别假名不会让整段文本被当作日文
+        """
+        self.zhThreshold = zhThreshold
+        self.kanaThreshold = kanaThreshold
+        self.cacheSize = cacheSize
+        self.languages = languages
+        self._cache = OrderedDict()  # key是文本，value是(语种, 分数)
+        self._identifier = None
+
+    def _fastPath(self, text):
+        """
+        根据文字体系快速判断语种
+        :param text: 文本
+        :return: (语种, 该语种文字的占比)，判断不了返回None
+        """
+        chars = len(text) - len(WHITESPACE.findall(text))
+        if chars <= 0:
+            return "und", 0.0
+        ratio = len(KANA_CHAR.findall(text)) * 1.0 / chars
+        if ratio >= self.kanaThreshold:
+            return "ja", ratio
+        ratio = len(HANGUL_CHAR.findall(text)) * 1.0 / chars
+        if ratio >= self.kanaThreshold:
+            return "ko", ratio
+        ratio = len(CJK_CHAR.findall(text)) * 1.0 / chars
+        if ratio >= self.zhThreshold:
+            return "zh", ratio
+        return None
+
+    def _classifyByModel(self, text):
+        if self._identifier is None:
+            if self.languages is None:
+                self._identifier = _getIdentifier()
+            else:
+                self._identifier = _newIdentifier()
+                self._identifier.set_languages(self.languages)
+        return self._identifier.classify(text)
+
+    def classify(self, text):
+        return self.classifyBatch([text])[0]
+
+    def classifyBatch(self, texts):
+        """
+        批量识别语种，相同的文本只识别一次
+        :param texts: 文本列表
+        :return: 每个文本的(语种, 分数)，快速判断时分数是该语种文字的占比，否则是langid的分数
+        """
+        found = {}
+        for text in texts:
+            if text in found:
+                continue
+            res = self._cache.get(text)
+            if res is not None:
+                self._cache.move_to_end(text)
+            else:
+                res = self._fastPath(text)
+                if res is None:
+                    res = self._classifyByModel(text)
+                self._put(text, res)
+            found[text] = res
+        return [found[text] for text in texts]
+
+    def _put(self, text, res):
+        self._cache[text] = res
+        if len(self._cache) > self.cacheSize:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def chineseSpans(text):
+        """
+        找到文本中所有的中文片段
+        :param text: 文本
+        :return: (开始下标, 结束下标, 片段)的列表
+        """
+        return [(m.start(), m.end(), m.group(0)) for m in CHINESE_SPAN.finditer(text)]
+
+    def route(self, texts, pipeline, withLanguage=False):
+        """
+        批量识别语种，只把中文片段交给pipeline处理
+        :param texts: 文本列表
+        :param pipeline: 处理中文片段的函数，如分词器的cut
+        :param withLanguage: 是否识别不含汉字的文本的语种，为False时这些文本的语种是None
+        :return: 每个文本的(语种, [(开始下标, 结束下标, pipeline的结果)])
+        """
+        hasCjk = [CJK_CHAR.search(text) is not None for text in texts]
+        if withLanguage:
+            langs = self.classifyBatch(texts)
+        else:
+            # 不含汉字的文本没有要交给pipeline的片段，不需要识别语种
+            found = iter(self.classifyBatch([text for text, cjk in zip(texts, hasCjk) if cjk]))
+            langs = [next(found) if cjk else (None, 0.0) for cjk in hasCjk]
+        res = []
+        for text, cjk, (lang, _) in zip(texts, hasCjk, langs):
+            spans = []
+            # 日文、韩文中的汉字不交给中文处理
+            if cjk and lang not in ("ja", "ko"):
+                for start, end, span in self.chineseSpans(text):
+                    spans.append((start, end, pipeline(span)))
+            res.append((lang, spans))
+        return res
+
+
+if __name__ == '__main__':
+    router = LangRouter()
+    print(router.classifyBatch(["中国", "北京天安门", "你好呀！中国"]))
+    print(router.chineseSpans("hello 你好呀！中国， 北京天安门 at 2006年5月10日"))
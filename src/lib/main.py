@@ -1,4 +1,3 @@
-import langid
-
 if __name__ == '__main__':
+    import langid
     print(langid.classify("中国"))
@@ -0,0 +1,120 @@
+import io
+import struct
+import sys
+from array import array
+
+"""
+紧凑的分词结果。分词器原来的返回值是一个由切片得到的字符串组成的list，大批量处理时会产生大量用不到的小字符串。
+Segmentation只保存原文和一个int32的下标数组（每个词的开始、结束下标依次排列），访问某个词时才切片生成字符串；
+HMM路径的概率作为单独的属性，不再混在词里。
+
+序列化时不复制下标数组：writeTo直接写出数组的内存，fromBuffer直接在收到的缓冲区上构造下标数组的memoryview。
+格式：词数(uint32) | 原文utf8字节数(uint32) | 概率(float64) | 原文utf8 | 下标数组(int32 * 2 * 词数)，整数均为小端序。
+"""
+
+_HEADER = struct.Struct("<IId")
+
+
+class Segmentation(object):
+    __slots__ = ("text", "offsets", "probability")
+
+    def __init__(self, text, offsets=None, probability=None):
+        # 原文
+        self.text = text
+        # 每个词的开始、结束下标依次排列，长度是词数的两倍
+        self.offsets = array("i") if offsets is None else offsets
+        # 路径的概率，只有HMM有
+        self.probability = probability
+
+    def append(self, begin, end):
+        self.offsets.append(begin)
+        self.offsets.append(end)
+
+    def __len__(self):
+        return len(self.offsets) // 2
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("segmentation index out of range")
+        return self.text[self.offsets[2 * i]: self.offsets[2 * i + 1]]
+
+    def __iter__(self):
+        text, offsets = self.text, self.offsets
+        for i in range(0, len(offsets), 2):
+            yield text[offsets[i]: offsets[i + 1]]
+
+    def __eq__(self, other):
+        if isinstance(other, Segmentation):
+            return self.text == other.text and list(self.offsets) == list(other.offsets)
+        if isinstance(other, list):
+            return self.toList() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return "Segmentation({0!r}, probability={1!r})".format(self.toList(), self.probability)
+
+    def spans(self):
+        """
+        :return: (开始下标, 结束下标)的生成器
+        """
+        offsets = self.offsets
+        for i in range(0, len(offsets), 2):
+            yield offsets[i], offsets[i + 1]
+
+    def lengths(self):
+        """
+        :return: 每个词的长度的生成器，不生成字符串
+        """
+        offsets = self.offsets
+        for i in range(0, len(offsets), 2):
+            yield offsets[i + 1] - offsets[i]
+
+    def toList(self):
+        return list(self)
+
+    def writeTo(self, f):
+        """
+        序列化写入文件或socket等，下标数组不复制
+        :param f: 有write方法的对象
+        :return: 写入的字节数
+        """
+        textBytes = self.text.encode("utf8")
+        offsets = self.offsets
+        if sys.byteorder != "little":
+            offsets = array("i", offsets)
+            offsets.byteswap()
+        header = _HEADER.pack(len(self), len(textBytes), -1.0 if self.probability is None else self.probability)
+        f.write(header)
+        f.write(textBytes)
+        f.write(memoryview(offsets).cast("B"))
+        return len(header) + len(textBytes) + len(offsets) * 4
+
+    def toBytes(self):
+        buffer = io.BytesIO()
+        self.writeTo(buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def fromBuffer(cls, buffer, pos=0):
+        """
+        从缓冲区反序列化，下标数组直接引用缓冲区中的内存（小端序的机器上）
+        :param buffer: bytes、bytearray、mmap等
+        :param pos: 开始位置
+        :return: Segmentation和下一条记录的开始位置
+        """
+        count, textLength, probability = _HEADER.unpack_from(buffer, pos)
+        pos += _HEADER.size
+        view = memoryview(buffer)
+        text = bytes(view[pos: pos + textLength]).decode("utf8")
+        pos += textLength
+        raw = view[pos: pos + count * 8]
+        if sys.byteorder == "little":
+            offsets = raw.cast("i")
+        else:
+            offsets = array("i", raw.tobytes())
+            offsets.byteswap()
+        return cls(text, offsets, None if probability < 0 else probability), pos + count * 8
@@ -0,0 +1,115 @@
+"""
+文档级的实体标注，一次完成时间和地名识别。
+TimeRecognition.recognize和NerLocation.locationNER各自处理原始文本，各自切分一遍，并且只返回字符串。这里只用jieba做一次分词和词性标注，
+时间识别直接使用分词和词性结果，地名识别使用每个字及其所在词的词性作为CRF的输入，最后返回带有类型和原文下标的实体。
+也支持以JSONL的形式流式处理大批量文档：每行一个json对象，text字段是文本，输出时加上tokens和entities字段。
+无法解析的行不中断处理，输出一个只有line（行号）和error字段的对象。
+
+用法（在ner目录下运行）：
+    python ner_document.py < docs.jsonl > annotated.jsonl
+"""
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import instrument, jiebaloader
+from ner.ner_time import TimeRecognition, withOffsets
+
+TIME = "TIME"
+LOCATION = "LOC"
+
+
+class DocumentAnnotator(object):
+    def __init__(self, locationModel="auto"):
+        """
+        :param locationModel: 地名识别使用的模型，"flag"使用带词性特征的模型，"char"使用只有字特征的模型，None不识别地名，
+                              "auto"优先使用带词性特征的模型，两个模型都不存在时不识别地名
+        """
+        self._timeRecognition = TimeRecognition()
+        if locationModel == "auto":
+            if os.path.exists("data/modelwithflag"):
+                locationModel = "flag"
+            elif os.path.exists("data/model"):
+                locationModel = "char"
+            else:
+                locationModel = None
+        self.locationModel = locationModel
+
+    def tokenize(self, text):
+        """
+        分词及词性标注
+        :param text: 文本
+        :return: (词, 词性, 开始下标, 结束下标)的列表
+        """
+        with instrument.timer("doc.posseg"):
+            return withOffsets(jiebaloader.getPosseg().cut(text))
+
+    def _locationSpans(self, text, tokens):
+        if self.locationModel == "flag":
+            from ner.ner_location_with_flag import NerLocationWithFlag
+            flags = []
+            for word, flag, _, _ in tokens:
+                flags.extend([flag] * len(word))
+            return NerLocationWithFlag.locationSpans(text, flags)
+        if self.locationModel == "char":
+            from ner.ner_location import NerLocation
+            return NerLocation.locationSpans(text)
+        return []
+
+    def annotate(self, text):
+        """
+        标注一篇文档
+        :param text: 文本
+        :return: 字典，tokens是分词结果，entities是实体列表，每个实体包含type、start、end、text，时间实体还有标准形式的value
+        """
+        instrument.incr("doc.chars", len(text))
+        tokens = self.tokenize(text) if text else []
+        entities = []
+        for value, begin, end in self._timeRecognition.recognizeTokens(tokens):
+            entities.append({"type": TIME, "start": begin, "end": end, "text": text[begin:end], "value": value})
+        if text:
+            for begin, end in self._locationSpans(text, tokens):
+                entities.append({"type": LOCATION, "start": begin, "end": end, "text": text[begin:end]})
+        entities.sort(key=lambda e: (e["start"], e["end"]))
+        return {"tokens": [list(t) for t in tokens], "entities": entities}
+
+    def annotateStream(self, inFile, outFile, textKey="text", withTokens=True):
+        """
+        流式处理JSONL，每次只处理一行
+        :param inFile: 输入，每行一个json对象
+        :param outFile: 输出，每行一个json对象，在输入的基础上加上tokens和entities
+        :param textKey: 文本所在的字段
+        :param withTokens: 是否输出分词结果
+        :return: 处理的文档数，不包括无法解析的行
+        """
+        count = 0
+        for lineNum, line in enumerate(inFile, 1):
+            line = line.strip()
+            if line == "":
+                continue
+            try:
+                doc = json.loads(line)
+            except json.JSONDecodeError as e:
+                self._writeError(outFile, lineNum, str(e))
+                continue
+            if not isinstance(doc, dict):
+                self._writeError(outFile, lineNum, "expected a json object")
+                continue
+            res = self.annotate(doc.get(textKey, ""))
+            if withTokens:
+                doc["tokens"] = res["tokens"]
+            doc["entities"] = res["entities"]
+            outFile.write(json.dumps(doc, ensure_ascii=False) + "\n")
+            count += 1
+        return count
+
+    @staticmethod
+    def _writeError(outFile, lineNum, message):
+        instrument.incr("doc.errors")
+        outFile.write(json.dumps({"line": lineNum, "error": message}, ensure_ascii=False) + "\n")
+
+
+if __name__ == '__main__':
+    annotator = DocumentAnnotator()
+    annotator.annotateStream(sys.stdin, sys.stdout)
@@ -1,5 +1,14 @@
+import os
+import sys
 import time
-import CRFPP
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import instrument
+from lib.corpuscache import CorpusCache, columnParser
+from lib.crftagger import CRFTagger
+
+_TAGGER = CRFTagger("data/model")
 
 class NerLocation:
     def handleCorpus(self):
@@ -19,22 +28,31 @@ class NerLocation:
                 file.write(ch[i] + "\t" + ta[i] + "\n")
             file.write("\n")
 
-        with open("data/people_daily.txt", mode="r", encoding="utf8") as corpus,\
-                open("data/trainingset.txt", mode="w", encoding="utf8") as training,\
+        # 语料缓存中已经是处理好的字和状态标签，只有语料变化时才重新解析
+        corpus = CorpusCache.load("data/people_daily.txt", "people_daily", NerLocation.parseCorpus, ("tag",))
+        with open("data/trainingset.txt", mode="w", encoding="utf8") as training,\
                 open("data/testset.txt", mode="w", encoding="utf8") as test:
-            lineNum = 0
-            for line in corpus:
-                line = line.strip("\r\n\t")
-                if line == "":
-                    continue
+            for lineNum in range(len(corpus)):
+                chars, values = corpus.sentence(lineNum)
+                if lineNum % 5 == 0:  # 20%为测试集
+                    save(chars, values["tag"], test)
                 else:
-                    words = line.split()[1:]
-                    chars, tags = self.handleLine(words)
-                    if lineNum % 5 == 0:  # 20%为测试集
-                        save(chars, tags, test)
-                    else:
-                        save(chars, tags, training)
-                lineNum += 1
+                    save(chars, values["tag"], training)
+        corpus.close()
+
+    @staticmethod
+    def parseCorpus(f):
+        """
+        解析人民日报语料，用于构建语料缓存
+        :param f: 行的迭代器
+        :return: (字集, {"tag": 状态标签集})的生成器
+        """
+        for line in f:
+            line = line.strip("\r\n\t")
+            if line == "":
+                continue
+            chars, tags = NerLocation.handleLine(line.split()[1:])
+            yield chars, {"tag": tags}
 
     def test(self, text):
         words = text.split()[1:]
@@ -110,50 +128,64 @@ class NerLocation:
 
     @staticmethod
     def calculatePRAndF1():
-        with open("data/testresult.txt", mode="r", encoding="utf8") as f:
-            allLocPre = 0  # 所有被模型识别为地名的数量
-            locPreCorr = 0  # 被模型识别为地名且正确的数量
-            allLocReal = 0  # 所有地名的数量
-            for line in f:
-                line = line.strip()
-                if line == "":
-                    continue
-                word, realFlag, preFlag = line.split()  # 字， 实际状态标注， 预测状态标注
-                if preFlag != "O":
-                    allLocPre += 1
-                if realFlag != "O":
-                    allLocReal += 1
-                if realFlag == preFlag:
-                    if not realFlag == "O":
-                        locPreCorr += 1
-            precision = locPreCorr * 1.0 / allLocPre  # 查准率
-            recall = locPreCorr * 1.0 / allLocReal  # 召回率
-            f1 = 2 * precision * recall / (precision + recall)  # 调和平均
-            return precision, recall, f1
+        columns = ("real", "pred")
+        corpus = CorpusCache.load("data/testresult.txt", "crf_result", columnParser(columns), columns)
+        realLabels, preLabels = corpus.labels["real"], corpus.labels["pred"]
+        # 统计每一对（实际状态标注id， 预测状态标注id）出现的次数
+        pairs = Counter(zip(corpus.column("real"), corpus.column("pred")))
+        corpus.close()
+        allLocPre = 0  # 所有被模型识别为地名的数量
+        locPreCorr = 0  # 被模型识别为地名且正确的数量
+        allLocReal = 0  # 所有地名的数量
+        for (real, pre), n in pairs.items():
+            realFlag, preFlag = realLabels[real], preLabels[pre]
+            if preFlag != "O":
+                allLocPre += n
+            if realFlag != "O":
+                allLocReal += n
+            if realFlag == preFlag:
+                if not realFlag == "O":
+                    locPreCorr += n
+        precision = locPreCorr * 1.0 / allLocPre  # 查准率
+        recall = locPreCorr * 1.0 / allLocReal  # 召回率
+        f1 = 2 * precision * recall / (precision + recall)  # 调和平均
+        return precision, recall, f1
 
     @staticmethod
     def locationNER(text):
-        tagger = CRFPP.Tagger("-m {0} -v 3 -n2".format("data/model"))
-        for c in text:
-            tagger.add(c)
-        res = []
-        tagger.parse()
-        builder = ""
-        for i in range(tagger.size()):
-            for j in range(tagger.xsize()):
-                ch = tagger.x(i, j)
-                tag = tagger.y2(i)
-                if tag == "B":
-                    builder = ch
-                elif tag == "M":
-                    builder += ch
-                elif tag == "E":
-                    builder += ch
-                    res.append(builder)
-                elif tag == "S":
-                    builder = ch
-                    res.append(builder)
-        return res
+        with instrument.timer("crf.locationNER"):
+            return _TAGGER.locations(text)
+
+    @staticmethod
+    def locationSpans(chars):
+        """
+        识别地名在原文中的位置
+        :param chars: 文本或字列表
+        :return: (开始下标, 结束下标)的列表
+        """
+        with instrument.timer("crf.locationSpans"):
+            return _TAGGER.spans(chars)
+
+    @staticmethod
+    def locationNBest(chars, n=2):
+        """
+        前n个标注序列对应的地名位置，用于主动学习中比较候选结果
+        :param chars: 文本或字列表
+        :param n: 标注序列数
+        :return: [(标注序列的条件概率, (开始下标, 结束下标)的列表)]，按概率从大到小排列
+        """
+        with instrument.timer("crf.nbest"):
+            return _TAGGER.nbestSpans(chars, n)
+
+    @staticmethod
+    def tokenConfidence(chars):
+        """
+        最优标注序列中每个字的标签及其边缘概率（CRF++的前向后向算法给出）
+        :param chars: 文本或字列表
+        :return: [(标签, 边缘概率)]
+        """
+        with instrument.timer("crf.confidence"):
+            return _TAGGER.confidence(chars)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,14 @@
+import os
+import sys
 import time
-import CRFPP
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import instrument
+from lib.corpuscache import CorpusCache, columnParser
+from lib.crftagger import CRFTagger
+
+_TAGGER = CRFTagger("data/modelwithflag")
 
 class NerLocationWithFlag:
     """
@@ -23,22 +32,32 @@ class NerLocationWithFlag:
                 file.write(ch[i] + "\t" + fl[i] + "\t" + ta[i] + "\n")
             file.write("\n")
 
-        with open("data/people_daily.txt", mode="r", encoding="utf8") as corpus,\
-                open("data/trainingsetwithflag.txt", mode="w", encoding="utf8") as training,\
+        # 语料缓存中已经是处理好的字、状态标签和词性，只有语料变化时才重新解析
+        corpus = CorpusCache.load("data/people_daily.txt", "people_daily_flag", NerLocationWithFlag.parseCorpus,
+                                  ("tag", "flag"), cachePath="data/people_daily.txt_flag_cache")
+        with open("data/trainingsetwithflag.txt", mode="w", encoding="utf8") as training,\
                 open("data/testsetwithflag.txt", mode="w", encoding="utf8") as test:
-            lineNum = 0
-            for line in corpus:
-                line = line.strip("\r\n\t")
-                if line == "":
-                    continue
+            for lineNum in range(len(corpus)):
+                chars, values = corpus.sentence(lineNum)
+                if lineNum % 5 == 0:  # 20%为测试集
+                    save(chars, values["tag"], values["flag"], test)
                 else:
-                    words = line.split()[1:]
-                    chars, tags, flags = self.handleLine(words)
-                    if lineNum % 5 == 0:  # 20%为测试集
-                        save(chars, tags, flags, test)
-                    else:
-                        save(chars, tags, flags, training)
-                lineNum += 1
+                    save(chars, values["tag"], values["flag"], training)
+        corpus.close()
+
+    @staticmethod
+    def parseCorpus(f):
+        """
+        解析人民日报语料，用于构建语料缓存
+        :param f: 行的迭代器
+        :return: (字集, {"tag": 状态标签集, "flag": 词性集})的生成器
+        """
+        for line in f:
+            line = line.strip("\r\n\t")
+            if line == "":
+                continue
+            chars, tags, flags = NerLocationWithFlag.handleLine(line.split()[1:])
+            yield chars, {"tag": tags, "flag": flags}
 
     def test(self, text):
         words = text.split()[1:]
@@ -125,50 +144,77 @@ class NerLocationWithFlag:
 
     @staticmethod
     def calculatePRAndF1():
-        with open("data/testresultwithflag.txt", mode="r", encoding="utf8") as f:
-            allLocPre = 0  # 所有被模型识别为地名的数量
-            locPreCorr = 0  # 被模型识别为地名且正确的数量
-            allLocReal = 0  # 所有地名的数量
-            for line in f:
-                line = line.strip()
-                if line == "":
-                    continue
-                word, _, realFlag, preFlag = line.split()  # 字， 实际状态标注， 预测状态标注
-                if preFlag != "O":
-                    allLocPre += 1
-                if realFlag != "O":
-                    allLocReal += 1
-                if realFlag == preFlag:
-                    if not realFlag == "O":
-                        locPreCorr += 1
-            precision = locPreCorr * 1.0 / allLocPre  # 查准率
-            recall = locPreCorr * 1.0 / allLocReal  # 召回率
-            f1 = 2 * precision * recall / (precision + recall)  # 调和平均
-            return precision, recall, f1
+        columns = ("flag", "real", "pred")
+        corpus = CorpusCache.load("data/testresultwithflag.txt", "crf_result", columnParser(columns), columns)
+        realLabels, preLabels = corpus.labels["real"], corpus.labels["pred"]
+        # 统计每一对（实际状态标注id， 预测状态标注id）出现的次数
+        pairs = Counter(zip(corpus.column("real"), corpus.column("pred")))
+        corpus.close()
+        allLocPre = 0  # 所有被模型识别为地名的数量
+        locPreCorr = 0  # 被模型识别为地名且正确的数量
+        allLocReal = 0  # 所有地名的数量
+        for (real, pre), n in pairs.items():
+            realFlag, preFlag = realLabels[real], preLabels[pre]
+            if preFlag != "O":
+                allLocPre += n
+            if realFlag != "O":
+                allLocReal += n
+            if realFlag == preFlag:
+                if not realFlag == "O":
+                    locPreCorr += n
+        precision = locPreCorr * 1.0 / allLocPre  # 查准率
+        recall = locPreCorr * 1.0 / allLocReal  # 召回率
+        f1 = 2 * precision * recall / (precision + recall)  # 调和平均
+        return precision, recall, f1
+
+    @staticmethod
+    def _rows(chars, flags):
+        """
+        每个字的特征：字和词性两列
+        """
+        return [c + "\t" + f for c, f in zip(chars, flags)]
 
     @staticmethod
     def locationNER(text):
-        tagger = CRFPP.Tagger("-m {0} -v 3 -n2".format("data/modelwithflag"))
-        for c in text:
-            tagger.add(c)
-        res = []
-        tagger.parse()
-        builder = ""
-        for i in range(tagger.size()):
-            for j in range(tagger.xsize()):
-                ch = tagger.x(i, j)
-                tag = tagger.y2(i)
-                if tag == "B":
-                    builder = ch
-                elif tag == "M":
-                    builder += ch
-                elif tag == "E":
-                    builder += ch
-                    res.append(builder)
-                elif tag == "S":
-                    builder = ch
-                    res.append(builder)
-        return res
+        """
+        识别地名，text的每一项作为一个字的特征添加
+        """
+        with instrument.timer("crf.locationNER"):
+            return _TAGGER.locations(text)
+
+    @staticmethod
+    def locationSpans(chars, flags):
+        """
+        识别地名在原文中的位置，词性作为第二列特征
+        :param chars: 文本或字列表
+        :param flags: 每个字所在词的词性
+        :return: (开始下标, 结束下标)的列表
+        """
+        with instrument.timer("crf.locationSpans"):
+            return _TAGGER.spans(NerLocationWithFlag._rows(chars, flags))
+
+    @staticmethod
+    def locationNBest(chars, flags, n=2):
+        """
+        前n个标注序列对应的地名位置，用于主动学习中比较候选结果
+        :param chars: 文本或字列表
+        :param flags: 每个字所在词的词性
+        :param n: 标注序列数
+        :return: [(标注序列的条件概率, (开始下标, 结束下标)的列表)]，按概率从大到小排列
+        """
+        with instrument.timer("crf.nbest"):
+            return _TAGGER.nbestSpans(NerLocationWithFlag._rows(chars, flags), n)
+
+    @staticmethod
+    def tokenConfidence(chars, flags):
+        """
+        最优标注序列中每个字的标签及其边缘概率（CRF++的前向后向算法给出）
+        :param chars: 文本或字列表
+        :param flags: 每个字所在词的词性
+        :return: [(标签, 边缘概率)]
+        """
+        with instrument.timer("crf.confidence"):
+            return _TAGGER.confidence(NerLocationWithFlag._rows(chars, flags))
 
 
 if __name__ == '__main__':
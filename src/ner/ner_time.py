@@ -1,10 +1,14 @@
 """
 命名实体识别之时间识别，通过分词及此行标注找到时间和数字词，再通过正则匹配解析时间并格式化为标准时间
 """
-from jieba import posseg as psg
+import os
+import sys
 from datetime import timedelta, datetime
 import re
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import instrument, jiebaloader
+
 ALL_NUM = re.compile(r"\d+$")
 DAY_PATTERN = re.compile(r"[号|日]\d+$")
 DIMENSION_PATTERN = re.compile(r"([0-9零一二两三四五六七八九十]+年)?([0-9零一二两三四五六七八九十]+月)?([0-9零一二两三四五六七八九十]+[号日])?([上中下午晚早]+)?([0-9零一二两三四五六七八九十百]+[点:\.时])?([0-9零一二两三四五六七八九十百]+分?)?([0-9零一二两三四五六七八九十百]+秒)?")
@@ -16,29 +20,74 @@ CN_NUM = {
 }
 CN_UNIT = {'十': 10, '百': 100, '千': 1000, '万': 10000}
 
+
+def withOffsets(cutResult):
+    """
+    给词性标注结果加上每个词在原文中的下标
+    :param cutResult: jieba.posseg的分词结果
+    :return: (词, 词性, 开始下标, 结束下标)的列表
+    """
+    res = []
+    begin = 0
+    for word, flag in cutResult:
+        res.append((word, flag, begin, begin + len(word)))
+        begin += len(word)
+    return res
+
+
 class TimeRecognition(object):
     def __init__(self):
         self._keyDayMap = {}
         self._loadKeyDayMap()
 
     def recognize(self, text: str):
+        with instrument.timer("time.recognize"):
+            return self._recognize(text)
+
+    def _recognize(self, text: str):
         res = []
         if not text == "":
+            instrument.incr("time.chars", len(text))
             # 先分词
-            cutRes = list(psg.cut(text))
+            with instrument.timer("time.posseg"):
+                cutRes = list(jiebaloader.getPosseg().cut(text))
             print("---- cut res -----")
             for i in range(len(cutRes)):
                 print(cutRes[i])
             # 拿到所有时间字符串
-            allTimeStr = self._findAllTimeStr(cutRes)
+            with instrument.timer("time.find"):
+                allTimeSpans = self._findAllTimeSpans(withOffsets(cutRes))
             print("-------all time str ----")
-            print(allTimeStr)
+            print([item[0] for item in allTimeSpans])
             # 筛选出合法的时间字符串, 转化为标准形式的时间
-            for item in allTimeStr:
-                if not self._checkTimeStr(item) is None:
-                    parseTime = self._parseTimeStr(item)
-                    if parseTime is not None:
-                        res.append(parseTime)
+            with instrument.timer("time.parse"):
+                res = [parseTime for parseTime, _, _ in self._parseTimeSpans(allTimeSpans)]
+            instrument.incr("time.found", len(res))
+        return res
+
+    def recognizeTokens(self, tokens):
+        """
+        从已经完成分词和词性标注的结果中识别时间，多个识别器可以共用同一次分词的结果
+        :param tokens: (词, 词性, 开始下标, 结束下标)的列表
+        :return: (标准形式的时间, 开始下标, 结束下标)的列表
+        """
+        with instrument.timer("time.recognizeTokens"):
+            res = self._parseTimeSpans(self._findAllTimeSpans(tokens))
+        instrument.incr("time.found", len(res))
+        return res
+
+    def _parseTimeSpans(self, timeSpans):
+        """
+        筛选出合法的时间字符串, 转化为标准形式的时间
+        :param timeSpans: (时间字符串, 开始下标, 结束下标)的列表
+        :return: (标准形式的时间, 开始下标, 结束下标)的列表
+        """
+        res = []
+        for item, begin, end in timeSpans:
+            if not self._checkTimeStr(item) is None:
+                parseTime = self._parseTimeStr(item)
+                if parseTime is not None:
+                    res.append((parseTime, begin, end))
         return res
 
     def _findAllTimeStr(self, cutResult):
@@ -47,27 +96,42 @@ class TimeRecognition(object):
         :param cutResult: 分词结果
         :return: 所有表示时间的字符串
         """
+        return [item[0] for item in self._findAllTimeSpans(withOffsets(cutResult))]
+
+    def _findAllTimeSpans(self, tokens):
+        """
+        拿到切分结果中所有表示时间的字符串及其在原文中的位置
+        :param tokens: (词, 词性, 开始下标, 结束下标)的列表
+        :return: (时间字符串, 开始下标, 结束下标)的列表
+        """
         res = []
         subTimeStr = ""  # 用于拼接时间字符串
-        for word, flag in cutResult:
+        subBegin, subEnd = 0, 0  # 正在拼接的时间字符串在原文中的位置
+        for word, flag, begin, end in tokens:
             if word in self._keyDayMap.keys():
                 if not subTimeStr == "":
                     # 停止拼接，加入结果中，置空等待下一次拼接
-                    res.append(subTimeStr)
+                    res.append((subTimeStr, subBegin, subEnd))
                     subTimeStr = ""
                 # 指示代词转化成相应的时间描述
                 t = datetime.today() + timedelta(days=self._keyDayMap.get(word, 0))
                 subTimeStr = str(t.year) + "年" + str(t.month) + "月" + str(t.day) + "日"
+                subBegin, subEnd = begin, end
             elif flag in ["m", "t"]:
                 # 时间字符串进行拼接
-                subTimeStr = word if subTimeStr == "" else subTimeStr + word
+                if subTimeStr == "":
+                    subTimeStr = word
+                    subBegin = begin
+                else:
+                    subTimeStr = subTimeStr + word
+                subEnd = end
             else:
                 # 如果正在拼接时间字符串，停止拼接，加入结果list，并置空等待下一次拼接
                 if not subTimeStr == "":
-                    res.append(subTimeStr)
+                    res.append((subTimeStr, subBegin, subEnd))
                     subTimeStr = ""
         if not subTimeStr == "":
-            res.append(subTimeStr)
+            res.append((subTimeStr, subBegin, subEnd))
         return res
 
 